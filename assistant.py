@@ -4,16 +4,29 @@ import time
 import os
 import re
 import json
-import wave
 import tempfile
 import base64
-from flask import Flask, request, jsonify, send_from_directory
+import io
+import queue
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from TTS.api import TTS
 import ollama
 from pydub import AudioSegment
 from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from session_store import SessionStore
+from roster import Roster, entity_words, record_key, render_records, to_plain
+from bulk_import import iter_bulk_records, validate_bulk_record
+from collections.abc import Mapping
+from file_watcher import FileWatcher
+from semantic_index import Embedder, SemanticIndex
+from model_router import ModelRouter, Tier
+from speculation import SpeculationStats, SpeculativeAnswer
 from vosk import Model, KaldiRecognizer
+import numpy as np
+import soundfile as sf
+import soxr
 
 app = Flask(__name__)
 CORS(app)
@@ -30,34 +43,268 @@ except Exception as e:
     print(f"❌ Error loading Vosk model: {e}")
     vosk_model = None
 
-# In-memory store for chat histories
-chat_histories = {}
+# Chat histories and the entities each session has resolved, kept in memory and
+# written behind to SQLite so they survive restarts and can be shared by workers
+SESSION_DB_PATH = os.environ.get("JARVISHA_SESSION_DB", "backend/data/sessions.db")
+session_store = SessionStore(
+    SESSION_DB_PATH,
+    shards=int(os.environ.get("JARVISHA_SESSION_SHARDS", "16")),
+    flush_interval=float(os.environ.get("JARVISHA_SESSION_FLUSH_SECONDS", "1.0")),
+    shared=os.environ.get("JARVISHA_SESSION_SHARED", "").lower() in ("1", "true", "yes"),
+)
 
 # Output audio directory
 AUDIO_DIR = "frontend/public"
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
+# Audio formats /speak can produce. WAV stays the default so older clients keep working;
+# Opus only accepts a handful of sample rates, so the TTS output is resampled for it.
+AUDIO_FORMATS = {
+    "ogg": {"mimetype": "audio/ogg", "format": "OGG", "subtype": "OPUS", "sample_rates": (8000, 12000, 16000, 24000, 48000)},
+    "mp3": {"mimetype": "audio/mpeg", "format": "MP3", "subtype": "MPEG_LAYER_III", "sample_rates": None},
+    "wav": {"mimetype": "audio/wav", "format": "WAV", "subtype": "PCM_16", "sample_rates": None},
+}
+AUDIO_FALLBACKS = {"ogg": ("ogg", "mp3", "wav"), "mp3": ("mp3", "wav"), "wav": ("wav",)}
+AUDIO_COMPRESSION_LEVEL = float(os.environ.get("JARVISHA_AUDIO_COMPRESSION", "0.5"))
+# Each /speak answer gets its own file; files older than this are cleaned up
+AUDIO_FILE_PREFIX = "answer-"
+AUDIO_FILE_MAX_AGE = 600
+# Still written for clients that don't ask for a format, which play this fixed name
+LEGACY_AUDIO_FILE = "output.wav"
+
 # --- Load data from JSON at startup ---
 JSON_STUDENT_FILE = "backend/data/students.json"
 JSON_PROFESSOR_FILE = "backend/data/professors.json"
 
-def load_data_from_json(file_path):
+# Fields used to match incoming records against existing ones on upsert and reload
+STUDENT_KEY_FIELDS = ("roll_no",)
+PROFESSOR_KEY_FIELDS = ("id", "email")
+
+# Keywords used for intent detection
+SELF_REFERENCES = ["my", "i", "me", "myself", "i am", "my name"]
+ACADEMIC_KEYWORDS = ["teaches", "teach", "professor", "teacher", "subject", "subjects", "physics", "math", "chemistry", "biology", "computer", "engineering"]
+TEACHER_SUBJECTS = ["physics", "mathematics", "math", "chemistry", "biology"]
+MARK_KEYWORDS = ["mark", "marks", "score", "scores", "grade", "grades"]
+
+# --- Roster-constrained recognition ---
+# In "roster" mode Vosk decodes against a phrase list built from the roster and the
+# intent keywords instead of its open vocabulary. Words missing from the model's
+# lexicon are ignored by Vosk, so very rare names still rely on fuzzy matching.
+RECOGNITION_MODE = os.environ.get("JARVISHA_RECOGNITION_MODE", "open")
+ROSTER_MIN_CONFIDENCE = 0.6
+GRAMMAR_COMMON_WORDS = [
+    # Question words and everyday function words
+    "what", "whats", "when", "where", "who", "whom", "whose", "why", "how", "which", "is", "are",
+    "was", "were", "be", "been", "am", "do", "does", "did", "done", "has", "have", "had", "can",
+    "could", "will", "would", "should", "shall", "may", "might", "must", "i", "me", "my", "mine",
+    "you", "your", "he", "him", "his", "she", "her", "hers", "they", "them", "their", "we", "our",
+    "us", "it", "its", "this", "that", "these", "those", "the", "a", "an", "of", "in", "on", "at",
+    "for", "to", "from", "by", "with", "about", "and", "or", "but", "not", "no", "yes", "if",
+    "than", "then", "so", "too", "very", "much", "many", "more", "most", "less", "least", "any",
+    "all", "some", "each", "every", "other", "only", "also", "just", "there", "here", "please",
+    "hello", "hi", "hey", "thanks", "thank", "okay", "ok",
+    # Verbs that show up in questions about the roster
+    "get", "got", "tell", "show", "give", "know", "find", "need", "want", "meet", "see", "talk",
+    "teach", "teaches", "taught", "teaching", "study", "studies", "studying", "pass", "passed",
+    "fail", "failed", "improve", "score", "scored", "prepare", "help", "contact", "reach", "call",
+    # Academic vocabulary
+    "better", "best", "worse", "worst", "good", "bad", "high", "higher", "highest", "low", "lower",
+    "lowest", "average", "total", "percentage", "percent", "attendance", "remarks", "remark",
+    "office", "hours", "email", "phone", "number", "advice", "name", "student", "students",
+    "doctor", "professor", "teacher", "faculty", "class", "year", "semester", "exam", "exams",
+    "test", "tests", "result", "results", "subject", "subjects", "department", "roll", "performance",
+]
+roster_grammar = None
+# Words of the grammar that name a roster entry or subject, as opposed to the common words
+roster_entity_words = frozenset()
+# Subject phrase -> subject name, from the known subjects, student marks and the professor roster
+subject_index = {}
+mark_subjects = {}
+professor_subjects = {}
+
+def _grammar_phrase(text):
+    words = re.sub(r"[^a-z' ]+", " ", str(text).lower()).split()
+    return " ".join("doctor" if word == "dr" else word for word in words)
+
+def rebuild_roster_grammar():
+    """Rebuild the Vosk phrase list from the current name and subject indexes"""
+    global roster_grammar, roster_entity_words
+    common = {_grammar_phrase(phrase) for phrase in
+              GRAMMAR_COMMON_WORDS + SELF_REFERENCES + ACADEMIC_KEYWORDS + MARK_KEYWORDS}
+    entities = {_grammar_phrase(phrase) for phrase in
+                list(students.view.names.keys()) + list(professors.view.names.keys()) + list(subject_index.keys())}
+    phrases = (common | entities) - {""}
+    # Subjects stay entities even though they are also intent keywords
+    common_words = {word for phrase in GRAMMAR_COMMON_WORDS + SELF_REFERENCES + MARK_KEYWORDS
+                    for word in _grammar_phrase(phrase).split()}
+    roster_entity_words = frozenset(word for phrase in entities for word in phrase.split()) - common_words
+    roster_grammar = json.dumps(sorted(phrases) + ["[unk]"])
+
+# --- Semantic retrieval over free-text fields ---
+# Remarks, backgrounds and office hours are embedded with a small local model so a
+# question only pulls the few closest notes into the prompt. Re-embedding runs on a
+# single background worker and only touches records whose text changed.
+EMBEDDING_MODEL_PATH = os.environ.get("JARVISHA_EMBEDDING_MODEL", "models/all-MiniLM-L6-v2")
+SEMANTIC_INDEX_PATH = "backend/data/semantic_index.npz"
+SEMANTIC_FIELDS = ("remarks", "background", "office_hours")
+SEMANTIC_TOP_K = 3
+SEMANTIC_MIN_SCORE = 0.35
+try:
+    semantic_index = SemanticIndex(Embedder(EMBEDDING_MODEL_PATH), SEMANTIC_INDEX_PATH)
+    print("✅ Embedding model loaded successfully")
+except Exception as e:
+    print(f"❌ Error loading embedding model, semantic search disabled: {e}")
+    semantic_index = None
+semantic_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic")
+semantic_sync_pending = threading.Event()
+
+def semantic_documents():
+    """Build key -> text for every record that has free text worth searching"""
+    documents = {}
+    for label, roster in (("student", students), ("professor", professors)):
+        for record in roster.records:
+            if not isinstance(record, Mapping) or not record.get("name"):
+                continue
+            parts = [f"{field.replace('_', ' ').capitalize()}: {record[field]}" for field in SEMANTIC_FIELDS
+                     if isinstance(record.get(field), str) and record[field].strip()]
+            if parts:
+                key = f"{label}:{record_key(record, roster.key_fields) or record['name']}"
+                documents[key] = f"{record['name']} ({label}). " + " ".join(parts)
+    return documents
+
+def _sync_semantic_index():
+    semantic_sync_pending.clear()
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return [] # Return empty list on error
+        embedded = semantic_index.sync(semantic_documents())
+        if embedded:
+            print(f"🧭 Semantic index updated: {embedded} document(s) embedded, {len(semantic_index)} total")
+    except Exception as e:
+        print(f"❌ Semantic index update failed: {e}")
+
+def schedule_semantic_sync():
+    # Collapse bursts of writes into one pass over the latest views
+    if semantic_index is not None and not semantic_sync_pending.is_set():
+        semantic_sync_pending.set()
+        semantic_pool.submit(_sync_semantic_index)
+
+def semantic_notes(question):
+    """Render the closest free-text notes for the prompt, or an empty string"""
+    if semantic_index is None:
+        return ""
+    try:
+        hits = semantic_index.search(question, k=SEMANTIC_TOP_K, min_score=SEMANTIC_MIN_SCORE)
+    except Exception as e:
+        print(f"❌ Semantic search failed: {e}")
+        return ""
+    return "\n".join(f"- {text}" for _key, text, _score in hits)
+
+def _mark_subjects(marks):
+    if isinstance(marks, Mapping):
+        return list(marks.keys())
+    if isinstance(marks, str):
+        return re.findall(r"([A-Za-z][A-Za-z ]*?)\s*-\s*\d+", marks)
+    return []
+
+def _subject_phrases(subjects):
+    phrases = {" ".join(entity_words(subject)): subject for subject in subjects}
+    phrases.pop("", None)
+    return phrases
+
+def rebuild_subject_index():
+    global subject_index
+    subjects = _subject_phrases(TEACHER_SUBJECTS)
+    subjects.update(mark_subjects)
+    subjects.update(professor_subjects)
+    subject_index = subjects
+
+def on_students_published(view):
+    """Refresh the subjects taken from marks and the grammar after the student roster changes"""
+    global mark_subjects
+    subjects = set()
+    for student in view.records:
+        if isinstance(student, Mapping):
+            subjects.update(_mark_subjects(student.get("marks")))
+    mark_subjects = _subject_phrases(subjects)
+    rebuild_subject_index()
+    rebuild_roster_grammar()
+    schedule_semantic_sync()
 
-# Load data into memory once
-student_data = load_data_from_json(JSON_STUDENT_FILE)
-professor_data = load_data_from_json(JSON_PROFESSOR_FILE)
+def on_professors_published(view):
+    """Refresh the subject index and grammar after the professor roster changes"""
+    global professor_subjects
+    professor_subjects = _subject_phrases(professor["subject"] for professor in view.records
+                                          if isinstance(professor, Mapping) and professor.get("subject"))
+    rebuild_subject_index()
+    rebuild_roster_grammar()
+    schedule_semantic_sync()
 
-# Convert data to a string format for prompt injection
-student_data_str = json.dumps(student_data, indent=2)
-professor_data_str = json.dumps(professor_data, indent=2)
+# Load data into memory once; later changes are published as new views
+students = Roster(JSON_STUDENT_FILE, STUDENT_KEY_FIELDS, alias_fields=("another_name",), on_publish=on_students_published)
+professors = Roster(JSON_PROFESSOR_FILE, PROFESSOR_KEY_FIELDS, on_publish=on_professors_published)
+on_students_published(students.view)
+on_professors_published(professors.view)
 
-print(f"✅ Loaded {len(student_data)} student records.")
-print(f"✅ Loaded {len(professor_data)} professor records.")
+print(f"✅ Loaded {len(students.records)} student records.")
+print(f"✅ Loaded {len(professors.records)} professor records.")
+
+# --- Hot reload of data files ---
+# Edits made by convert_data.py or by hand are diffed against the loaded records and
+# only the changed ones are applied, without restarting the process or reloading models.
+def on_data_file_changed(path):
+    for roster, label in ((students, "student"), (professors, "professor")):
+        if os.path.abspath(roster.file_path) == path:
+            summary = roster.reload_from_disk()
+            if summary:
+                print(f"🔄 Reloaded {label} data: {summary['added']} added, {summary['changed']} changed, "
+                      f"{summary['removed']} removed ({summary['total']} total)")
+
+data_watcher = FileWatcher([JSON_STUDENT_FILE, JSON_PROFESSOR_FILE], on_data_file_changed)
+data_watcher.start()
+
+# Rosters above this size are not pasted into the prompt whole; only the record being discussed is
+PROMPT_ROSTER_LIMIT = int(os.environ.get("JARVISHA_PROMPT_ROSTER_LIMIT", "200"))
+
+GEMMA_MODEL = "gemma3:1b"
+
+# --- Model routing ---
+# Queries are classified and sent to a model tier: roster lookups and short factual
+# questions go to the small model, open-ended advice to the large one when
+# JARVISHA_MODEL_LARGE names one. Models stay loaded via keep_alive and a keep-warm
+# ping, and the large tier falls back to the small one when it is busy, has been
+# slow, or its model cannot be reached.
+MODEL_KEEP_ALIVE = os.environ.get("JARVISHA_MODEL_KEEP_ALIVE", "30m")
+MODEL_SMALL = os.environ.get("JARVISHA_MODEL_SMALL", GEMMA_MODEL)
+MODEL_LARGE = os.environ.get("JARVISHA_MODEL_LARGE")
+# Errors that mean the model itself is missing or Ollama is down, as opposed to a bad request
+MODEL_UNAVAILABLE_ERRORS = (ollama.ResponseError, ConnectionError)
+ADVICE_KEYWORDS = ["improve", "better", "advice", "suggest", "tips", "how can", "how do", "how should",
+                   "should i", "why", "explain", "plan", "prepare", "struggling"]
+LOOKUP_KEYWORDS = MARK_KEYWORDS + ["attendance", "email", "phone", "office hours", "remarks", "roll"]
+model_tiers = [Tier("small", MODEL_SMALL, max_concurrent=4)]
+if MODEL_LARGE:
+    model_tiers.append(Tier("large", MODEL_LARGE, max_concurrent=1,
+                            slow_seconds=float(os.environ.get("JARVISHA_MODEL_LARGE_SLOW_SECONDS", "8"))))
+model_router = ModelRouter(
+    tiers=model_tiers,
+    routes={"lookup": "small", "short": "small", "advice": "large" if MODEL_LARGE else "small"},
+    fallbacks={"large": "small"},
+    keep_alive=MODEL_KEEP_ALIVE,
+)
+
+def classify_query(question):
+    """Sort a question into lookup, short factual or open advice"""
+    lowered = question.lower()
+    if any(keyword in lowered for keyword in ADVICE_KEYWORDS) or len(lowered.split()) > 25:
+        return "advice"
+    if any(keyword in lowered for keyword in LOOKUP_KEYWORDS) or find_entities(question):
+        return "lookup"
+    return "short"
+
+def warm_model(model):
+    # An empty prompt loads the model (or refreshes its keep_alive) without generating
+    ollama.generate(model=model, prompt="", keep_alive=MODEL_KEEP_ALIVE)
+
+GEMMA_ERROR_ANSWER = "I'm sorry, I couldn't find an answer at the moment."
 
 def clean_response(text):
     cleaned = re.sub(r"\*+", "", text)
@@ -124,14 +371,60 @@ def find_student_by_name(name, students):
     
     return best_match
 
-def get_professor_for_subject(subject, professor_data_str):
-    """Directly parse professor data to find who teaches a subject"""
+def find_entities(text):
+    """Return the last student, professor and subject mentioned in text, by canonical name"""
+    words = entity_words(text)
+    indexes = (("student", students.view.names), ("professor", professors.view.names), ("subject", subject_index))
+    found = {}
+    position = 0
+    while position < len(words):
+        step = 1
+        # Prefer the longest phrase starting here, e.g. "santhosh kumar" over "santhosh"
+        for size in (3, 2, 1):
+            phrase = " ".join(words[position:position + size])
+            matched = False
+            for kind, index in indexes:
+                name = index.get(phrase)
+                if name is not None:
+                    found[kind] = name
+                    matched = True
+            if matched:
+                step = size
+                break
+        position += step
+    return found
+
+class SessionState:
+    """Entities resolved so far in a conversation, updated incrementally after each turn"""
+
+    def __init__(self, student=None, subject=None, professor=None):
+        self.student = student
+        self.subject = subject
+        self.professor = professor
+
+    def update(self, question, answer=""):
+        # The answer is scanned after the question so its mentions count as more recent
+        for text in (question, answer):
+            for kind, name in find_entities(text).items():
+                setattr(self, kind, name)
+
+    def to_dict(self):
+        return {"student": self.student, "subject": self.subject, "professor": self.professor}
+
+    def describe(self, student=None, subject=None, professor=None):
+        lines = [
+            f"Student being discussed: {student or self.student or 'none yet'}",
+            f"Subject being discussed: {subject or self.subject or 'none yet'}",
+            f"Professor being discussed: {professor or self.professor or 'none yet'}",
+        ]
+        return "\n".join(lines)
+
+def get_professor_for_subject(subject, professor_records):
+    """Directly search professor data to find who teaches a subject"""
     try:
-        import json
-        professors = json.loads(professor_data_str)
         subject_lower = subject.lower()
         
-        for professor in professors:
+        for professor in professor_records:
             if professor.get('subject', '').lower() == subject_lower:
                 return f"{professor.get('name', 'Unknown')} teaches {professor.get('subject', 'Unknown')}"
         
@@ -139,43 +432,47 @@ def get_professor_for_subject(subject, professor_data_str):
     except:
         return f"Error finding professor for {subject}"
 
-def get_gemma3_response(question, student_data_str, professor_data_str, history):
+def _prompt_record(record, focused):
+    # With the semantic index active, free text of the bulk roster reaches the prompt only
+    # as Relevant Notes; the record being asked about keeps its own so it never depends on ranking
+    if semantic_index is None or focused or not isinstance(record, Mapping):
+        return record
+    return {field: value for field, value in record.items() if field not in SEMANTIC_FIELDS}
+
+def render_roster_for_prompt(view, focus=None):
+    """Render records for the prompt on demand: the whole roster while it is small, else just the one in focus"""
+    focused = view.find(focus)
+    if len(view.records) <= PROMPT_ROSTER_LIMIT:
+        records = view.records
+    else:
+        records = [focused] if focused is not None else []
+    return render_records([_prompt_record(record, record is focused) for record in records])
+
+def plan_gemma3_response(question, student_view, professor_view, history, state=None):
+    """Return (answer, None) when the question can be answered directly, else (None, prompt)"""
     history_str = "\n".join([f"User: {turn['user']}\nAssistant: {turn['ai']}" for turn in history]) if history else "No conversation history yet."
+    state = state or SessionState()
+    mentioned = find_entities(question)
 
     # Check if user is asking about themselves specifically
-    self_references = ["my", "i", "me", "myself", "i am", "my name"]
-    is_self_reference = any(ref in question.lower() for ref in self_references)
+    is_self_reference = any(ref in question.lower() for ref in SELF_REFERENCES)
     
     # Check if it's a general academic question (about subjects, professors, etc.)
-    academic_keywords = ["teaches", "teach", "professor", "teacher", "subject", "subjects", "physics", "math", "chemistry", "biology", "computer", "engineering"]
-    is_academic_question = any(keyword in question.lower() for keyword in academic_keywords)
+    is_academic_question = any(keyword in question.lower() for keyword in ACADEMIC_KEYWORDS)
     
     # Check if we're in the middle of a conversation about a specific student
-    current_student = None
-    if history:
-        # Look for recent mentions of student names in the conversation
-        import json
-        try:
-            students = json.loads(student_data_str)
-            for student in students:
-                student_name = student.get('name', '').lower()
-                if student_name and student_name in history_str.lower():
-                    current_student = student
-                    break
-        except:
-            pass
+    current_student = mentioned.get("student") or state.student
     
     # Only ask for personal identification if it's a self-reference AND not an academic question
-    if is_self_reference and not is_academic_question and student_data_str != "[]" and not current_student:
+    if is_self_reference and not is_academic_question and student_view.records and not current_student:
         # Check if the user just provided their name in this question
-        import json
         try:
-            students = json.loads(student_data_str)
+            student_records = student_view.records
             # Extract potential name from the question
             words = question.lower().split()
             for word in words:
                 if len(word) > 2:  # Skip short words
-                    found_student = find_student_by_name(word, students)
+                    found_student = find_student_by_name(word, student_records)
                     if found_student:
                         current_student = found_student
                         break
@@ -183,34 +480,32 @@ def get_gemma3_response(question, student_data_str, professor_data_str, history)
             pass
         
         if not current_student:
-            return "I'd be happy to help you with your information! Could you please tell me your name or student ID so I can look up your specific details?"
+            return "I'd be happy to help you with your information! Could you please tell me your name or student ID so I can look up your specific details?", None
 
     # Check if it's specifically asking about who teaches a subject
     if "teaches" in question.lower() or "teacher" in question.lower():
         # Extract subject from question
-        subjects = ["physics", "mathematics", "math", "chemistry", "biology"]
-        for subject in subjects:
+        for subject in TEACHER_SUBJECTS:
             if subject in question.lower():
-                return get_professor_for_subject(subject, professor_data_str)
+                return get_professor_for_subject(subject, professor_view.records), None
+        # "Who teaches it?" refers back to the subject under discussion
+        subject = mentioned.get("subject") or state.subject
+        if subject:
+            return get_professor_for_subject(subject, professor_view.records), None
 
-    # Check if asking about marks without specifying a student
-    mark_keywords = ["mark", "marks", "score", "scores", "grade", "grades"]
-    if any(keyword in question.lower() for keyword in mark_keywords):
-        # Check if a student name is mentioned
-        import json
-        try:
-            students = json.loads(student_data_str)
-            student_mentioned = False
-            for student in students:
-                student_name = student.get('name', '').lower()
-                if student_name and student_name in question.lower():
-                    student_mentioned = True
-                    break
-            
-            if not student_mentioned:
-                return "Which student's marks would you like to know?"
-        except:
-            pass
+    # Check if asking about marks without a student named now or earlier in the conversation
+    if any(keyword in question.lower() for keyword in MARK_KEYWORDS) and not current_student:
+        return "Which student's marks would you like to know?", None
+
+    if isinstance(current_student, Mapping):
+        current_student = current_student.get("name")
+    student_data_str = render_roster_for_prompt(student_view, focus=current_student)
+    professor_data_str = render_roster_for_prompt(professor_view, focus=mentioned.get("professor") or state.professor)
+    notes = semantic_notes(question)
+    notes_str = f"\nRelevant Notes (closest matches to the question):\n{notes}\n" if notes else ""
+    context_str = state.describe(student=current_student,
+                                 subject=mentioned.get("subject"),
+                                 professor=mentioned.get("professor"))
 
     prompt = f"""You are Jarvisha, a helpful AI assistant for students and professors. Give simple, direct answers.
 
@@ -238,9 +533,12 @@ If the question is completely unrelated to education or academic topics, reply w
 ---
 Student Information:
 {student_data_str}
-
+{notes_str}
 Previous Conversation:
 {history_str}
+
+Conversation Context:
+{context_str}
 ---
 
 User Question: "{question}"
@@ -253,20 +551,104 @@ IMPORTANT:
 
 Give a simple, direct answer. No long explanations or formal language. Just the facts.
 """
-    try:
-        response = ollama.chat(
-            model="gemma3:1b",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return clean_response(response['message']['content'])
-    except Exception as e:
-        print("Gemma error:", e)
-        return "I'm sorry, I couldn't find an answer at the moment."
+    return None, prompt
+
+def _fall_back(lease, failed, error):
+    """Take a tier whose model is unreachable out of rotation; True if another tier can retry"""
+    print(f"Gemma error on {lease.model}:", error)
+    model_router.mark_unavailable(lease)
+    if not model_router.has_fallback(lease):
+        return False
+    failed.add(lease.tier.name)
+    return True
+
+def get_gemma3_response(question, student_view, professor_view, history, state=None):
+    answer, prompt = plan_gemma3_response(question, student_view, professor_view, history, state)
+    if answer is not None:
+        return answer
+    query_class = classify_query(question)
+    failed = set()
+    while True:
+        try:
+            with model_router.use(query_class, skip=failed) as lease:
+                response = ollama.chat(
+                    model=lease.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    keep_alive=MODEL_KEEP_ALIVE
+                )
+            return clean_response(response['message']['content'])
+        except MODEL_UNAVAILABLE_ERRORS as e:
+            if not _fall_back(lease, failed, e):
+                return GEMMA_ERROR_ANSWER
+        except Exception as e:
+            print("Gemma error:", e)
+            return GEMMA_ERROR_ANSWER
+
+def stream_gemma3_response(question, student_view, professor_view, history, state=None, raise_errors=False):
+    """Yield the answer in pieces as the model produces them.
+
+    A failed generation ends with GEMMA_ERROR_ANSWER, or raises with raise_errors.
+    """
+    answer, prompt = plan_gemma3_response(question, student_view, professor_view, history, state)
+    if answer is not None:
+        yield answer
+        return
+    query_class = classify_query(question)
+    failed = set()
+    produced = False
+    while True:
+        try:
+            with model_router.use(query_class, skip=failed) as lease:
+                for chunk in ollama.chat(
+                    model=lease.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    stream=True,
+                    keep_alive=MODEL_KEEP_ALIVE
+                ):
+                    content = chunk['message']['content']
+                    if content:
+                        lease.mark_first_token()
+                        produced = True
+                        yield content
+            return
+        except MODEL_UNAVAILABLE_ERRORS as e:
+            # Half an answer can't be continued on another model
+            if produced:
+                print("Gemma error:", e)
+            elif _fall_back(lease, failed, e):
+                continue
+            error = e
+        except Exception as e:
+            print("Gemma error:", e)
+            error = e
+        if raise_errors:
+            raise error
+        if not produced:
+            yield GEMMA_ERROR_ANSWER
+        return
 
 @app.route("/")
 def home():
     return jsonify({"status": "Backend is running."})
 
+@app.route("/metrics/models", methods=["GET"])
+def model_metrics():
+    return jsonify(model_router.stats())
+
+def load_session(session_id):
+    """Snapshot a session's history and entity state for one turn"""
+    with session_store.session(session_id) as session:
+        history = list(session.data.get("history", []))
+        state = SessionState(**session.data.get("state", {}))
+    return history, state
+
+def save_turn(session_id, question, answer, state):
+    with session_store.session(session_id, write=True) as session:
+        session.data.setdefault("history", []).append({"user": question, "ai": answer})
+        state.update(question, answer)
+        session.data["state"] = state.to_dict()
+        session.touch()
+
 @app.route("/query", methods=["POST"])
 def handle_query():
     data = request.get_json()
@@ -276,31 +658,278 @@ def handle_query():
     if not session_id:
         return jsonify({"error": "Session ID is missing"}), 400
 
-    history = chat_histories.get(session_id, [])
+    history, state = load_session(session_id)
 
-    answer = get_gemma3_response(question, student_data_str, professor_data_str, history)
+    answer = get_gemma3_response(question, students.view, professors.view, history, state)
 
-    history.append({"user": question, "ai": answer})
-    chat_histories[session_id] = history
+    save_turn(session_id, question, answer, state)
 
     return jsonify({"answer": answer})
 
+def negotiate_audio_format(requested=None):
+    """Pick an output format from an explicit parameter or the Accept header, defaulting to WAV"""
+    if requested in AUDIO_FORMATS:
+        return requested
+    # Only honour audio types the client names explicitly; */* keeps the WAV default
+    for mimetype, _quality in request.accept_mimetypes:
+        for name, spec in AUDIO_FORMATS.items():
+            if spec["mimetype"] == mimetype:
+                return name
+    return "wav"
+
+def encode_audio(samples, sample_rate, audio_format):
+    """Encode mono float PCM in memory, returning (format, bytes) with fallback to the next format"""
+    samples = np.asarray(samples, dtype=np.float32)
+    peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+    samples = np.clip(samples / max(0.01, peak), -1.0, 1.0)
+
+    for name in AUDIO_FALLBACKS[audio_format]:
+        spec = AUDIO_FORMATS[name]
+        data, rate = samples, sample_rate
+        if spec["sample_rates"] and rate not in spec["sample_rates"]:
+            rate = min((r for r in spec["sample_rates"] if r >= sample_rate), default=max(spec["sample_rates"]))
+            data = soxr.resample(samples, sample_rate, rate)
+        options = {} if name == "wav" else {"compression_level": AUDIO_COMPRESSION_LEVEL}
+        buffer = io.BytesIO()
+        try:
+            sf.write(buffer, data, rate, format=spec["format"], subtype=spec["subtype"], **options)
+        except (RuntimeError, TypeError, ValueError) as e:
+            print(f"⚠️ {name} encoding unavailable, falling back: {e}")
+            continue
+        return name, buffer.getvalue()
+    raise RuntimeError(f"No encoder available for {audio_format}")
+
+# The TTS model is shared by /speak and /converse and is not safe to run concurrently
+tts_lock = Lock()
+
+def synthesize_audio(text, audio_format):
+    with tts_lock:
+        samples = tts.tts(text=text)
+    return encode_audio(samples, tts.synthesizer.output_sample_rate, audio_format)
+
+def remove_old_audio_files():
+    cutoff = time.time() - AUDIO_FILE_MAX_AGE
+    for entry in os.scandir(AUDIO_DIR):
+        if entry.name.startswith(AUDIO_FILE_PREFIX):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass  # Already removed by a concurrent request
+
+def write_audio_file(audio_format, payload):
+    """Write one answer to a file of its own and return its name"""
+    # The name is unique per request and only handed out once the file is complete,
+    # so concurrent clients never share or half-read each other's answers
+    fd, output_path = tempfile.mkstemp(dir=AUDIO_DIR, prefix=AUDIO_FILE_PREFIX, suffix=f".{audio_format}")
+    with os.fdopen(fd, "wb") as f:
+        f.write(payload)
+    remove_old_audio_files()
+    return os.path.basename(output_path)
+
+def write_legacy_audio_file(payload):
+    # Older clients ignore "file" and fetch output.wav; swap it in whole so they never
+    # read a partial answer (they still share the one file, as they always have)
+    fd, temp_path = tempfile.mkstemp(dir=AUDIO_DIR, prefix=LEGACY_AUDIO_FILE, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(payload)
+    os.replace(temp_path, os.path.join(AUDIO_DIR, LEGACY_AUDIO_FILE))
+
 @app.route("/speak", methods=["POST"])
 def speak():
     try:
         data = request.get_json()
         text = data.get("text", "")
         cleaned_text = clean_response(text)
-        output_path = os.path.join(AUDIO_DIR, "output.wav")
-        tts.tts_to_file(text=cleaned_text, file_path=output_path)
-        return jsonify({"status": "ok"}), 200
+        explicit = data.get("format") or request.args.get("format")
+        requested = negotiate_audio_format(explicit)
+        audio_format, payload = synthesize_audio(cleaned_text, requested)
+        filename = write_audio_file(audio_format, payload)
+        if explicit is None and audio_format == "wav":
+            write_legacy_audio_file(payload)
+        return jsonify({"status": "ok", "file": filename, "format": audio_format}), 200
     except Exception as e:
         print("TTS error:", e)
         return jsonify({"error": "TTS processing failed"}), 500
 
 @app.route("/audio/<filename>")
 def serve_audio(filename):
-    return send_from_directory(AUDIO_DIR, filename, mimetype="audio/wav")
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    mimetype = AUDIO_FORMATS.get(extension, AUDIO_FORMATS["wav"])["mimetype"]
+    # conditional=True answers Range requests with 206 so playback can start and seek
+    # before the whole file has arrived; the body is streamed from disk in blocks
+    return send_from_directory(AUDIO_DIR, filename, mimetype=mimetype, conditional=True, max_age=0)
+
+# --- Voice activity detection ---
+# Energy-based VAD that trims silence before decoding and splits long dictations at
+# pauses so the pieces can be decoded in parallel.
+VOSK_SAMPLE_RATE = 16000
+VAD_FRAME_MS = 30
+VAD_MIN_ENERGY = 300.0       # RMS (int16 scale) below which a frame is always silence
+VAD_NOISE_RATIO = 3.0        # frames this far above the noise floor count as speech
+VAD_MAX_THRESHOLD = 1000.0   # cap on the adaptive threshold; a floor above it means there was no silence
+VAD_MIN_SPEECH_MS = 250      # if VAD keeps less than this, the whole clip is decoded instead
+VAD_MIN_PAUSE_MS = 400       # shorter gaps are treated as part of the same phrase
+VAD_PADDING_MS = 150         # context kept around each speech region
+VAD_SEGMENT_SECONDS = 8.0    # regions are packed into segments of about this length
+VOSK_CHUNK_FRAMES = 4000
+
+decode_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="vosk")
+
+class RecognitionStats:
+    """How often roster-mode segments fall back to a second, open decode"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.segments = 0
+        self.fallbacks = 0
+
+    def record(self, segments, fallbacks):
+        with self._lock:
+            self.segments += segments
+            self.fallbacks += fallbacks
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "roster_segments": self.segments,
+                "roster_fallbacks": self.fallbacks,
+                "fallback_rate": round(self.fallbacks / self.segments, 3) if self.segments else None,
+            }
+
+recognition_stats = RecognitionStats()
+
+def detect_speech_regions(samples, sample_rate):
+    """Return [(start, end)] sample ranges that contain speech, merged across short pauses"""
+    frame_len = int(sample_rate * VAD_FRAME_MS / 1000)
+    frame_count = len(samples) // frame_len
+    if frame_count == 0:
+        return []
+
+    frames = samples[:frame_count * frame_len].astype(np.float32).reshape(frame_count, frame_len)
+    energy = np.sqrt(np.mean(frames * frames, axis=1))
+    noise_floor = np.percentile(energy, 10)
+    threshold = noise_floor * VAD_NOISE_RATIO
+    if threshold > VAD_MAX_THRESHOLD:
+        # The quietest frames are already speech (no leading silence), so keep everything
+        return [(0, len(samples))]
+    voiced = energy > max(VAD_MIN_ENERGY, threshold)
+    if not voiced.any():
+        return []
+
+    # Edges of each voiced run, as frame indices
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    min_pause = VAD_MIN_PAUSE_MS // VAD_FRAME_MS
+    padding = int(sample_rate * VAD_PADDING_MS / 1000)
+    regions = []
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] < min_pause:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    return [(max(0, start * frame_len - padding), min(len(samples), end * frame_len + padding))
+            for start, end in regions]
+
+def split_into_segments(regions, sample_rate):
+    """Pack consecutive speech regions into segments, cutting only at pauses"""
+    max_len = int(sample_rate * VAD_SEGMENT_SECONDS)
+    segments = []
+    for start, end in regions:
+        if segments and end - segments[-1][0] <= max_len:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+    return segments
+
+def decode_segment(samples, sample_rate, grammar=None):
+    """Run one Vosk recognizer over an int16 segment and return its parsed final result"""
+    if grammar:
+        rec = KaldiRecognizer(vosk_model, sample_rate, grammar)
+    else:
+        rec = KaldiRecognizer(vosk_model, sample_rate)
+    rec.SetWords(True)
+    pcm = samples.tobytes()
+    step = VOSK_CHUNK_FRAMES * 2
+    for offset in range(0, len(pcm), step):
+        rec.AcceptWaveform(pcm[offset:offset + step])
+    return json.loads(rec.FinalResult())
+
+def result_confidence(result, entity_words):
+    """Confidence of a constrained decode, judged on the roster names and subjects it heard.
+
+    Without any, it is only trusted if every word was in the grammar.
+    """
+    words = result.get("result") or []
+    judged = [word for word in words if word.get("word") in entity_words]
+    if not judged:
+        if not words or any(word.get("word") == "[unk]" for word in words):
+            return 0.0
+        judged = words
+    return sum(word.get("conf", 0.0) for word in judged) / len(judged)
+
+def decode_segment_constrained(samples, sample_rate, grammar, entity_words):
+    """Decode against the roster grammar, falling back to open decoding on a weak match"""
+    result = decode_segment(samples, sample_rate, grammar)
+    if result_confidence(result, entity_words) < ROSTER_MIN_CONFIDENCE:
+        result = decode_segment(samples, sample_rate)
+        result["fallback"] = True
+    else:
+        # Filler the grammar couldn't place; the names around it are what the decode is for
+        result["text"] = " ".join(word for word in result.get("text", "").split() if word != "[unk]")
+    return result
+
+def transcribe_samples(samples, sample_rate=VOSK_SAMPLE_RATE, mode="open"):
+    """Trim silence, decode the speech segments in parallel and join them in order"""
+    started = time.perf_counter()
+    regions = detect_speech_regions(samples, sample_rate)
+    # A quiet mic can leave VAD with nothing; decode the whole clip rather than drop it
+    vad_fallback = sum(end - start for start, end in regions) < sample_rate * VAD_MIN_SPEECH_MS / 1000
+    if vad_fallback and len(samples):
+        regions = [(0, len(samples))]
+    segments = split_into_segments(regions, sample_rate)
+
+    grammar = roster_grammar if mode == "roster" else None
+    if grammar:
+        entity_words = roster_entity_words
+        decode = lambda seg: decode_segment_constrained(samples[seg[0]:seg[1]], sample_rate, grammar, entity_words)
+    else:
+        decode = lambda seg: decode_segment(samples[seg[0]:seg[1]], sample_rate)
+    # Vosk releases the GIL while decoding, so segments really do run on separate cores
+    results = list(decode_pool.map(decode, segments))
+    transcript = " ".join(r.get("text", "").strip() for r in results if r.get("text", "").strip())
+
+    stats = {
+        "audio_seconds": round(len(samples) / sample_rate, 3),
+        "speech_seconds": round(sum(end - start for start, end in segments) / sample_rate, 3),
+        "segments": len(segments),
+        "mode": "roster" if grammar else "open",
+        "fallbacks": sum(1 for r in results if r.get("fallback")),
+        "vad_fallback": vad_fallback,
+        "decode_seconds": round(time.perf_counter() - started, 3),
+    }
+    if grammar:
+        recognition_stats.record(stats["segments"], stats["fallbacks"])
+    return transcript, stats
+
+def decode_audio_bytes(audio_bytes):
+    """Convert an uploaded recording (webm, ogg, wav...) to mono 16 kHz int16 samples"""
+    # Create temporary file for conversion
+    with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as temp_input:
+        temp_input.write(audio_bytes)
+        temp_input_path = temp_input.name
+    try:
+        audio = AudioSegment.from_file(temp_input_path)
+        # Force mono, 16kHz, 16-bit for Vosk compatibility
+        audio = audio.set_channels(1).set_frame_rate(VOSK_SAMPLE_RATE).set_sample_width(2)
+        samples = np.frombuffer(audio.raw_data, dtype=np.int16)
+        print(f"🔄 Audio converted to PCM (mono, 16kHz): {len(samples)} frames")
+        return samples
+    finally:
+        # Clean up
+        os.unlink(temp_input_path)
 
 # 🔊 Offline Speech Recognition using Vosk
 @app.route("/recognize", methods=["POST", "OPTIONS"])
@@ -336,65 +965,306 @@ def recognize_speech():
         audio_bytes = base64.b64decode(audio_data.split(',')[1])
         print(f"🔊 Decoded audio bytes: {len(audio_bytes)} bytes")
         
-        # Create temporary files for conversion
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as temp_input:
-            temp_input.write(audio_bytes)
-            temp_input_path = temp_input.name
-        
-        temp_output_path = tempfile.mktemp(suffix='.wav')
-        
-        print(f"💾 Temporary input file created: {temp_input_path}")
-        
-        # Convert audio to WAV using pydub
         try:
-            audio = AudioSegment.from_file(temp_input_path)
-            # Force mono and 16kHz for Vosk compatibility
-            audio = audio.set_channels(1).set_frame_rate(16000)
-            audio.export(temp_output_path, format="wav")
-            print(f"🔄 Audio converted to WAV (mono, 16kHz): {temp_output_path}")
+            samples = decode_audio_bytes(audio_bytes)
         except Exception as e:
             print(f"❌ Audio conversion failed: {e}")
-            # Clean up
-            os.unlink(temp_input_path)
             return jsonify({"error": "Audio conversion failed"}), 500
         
-        # Read WAV file with Vosk
-        with wave.open(temp_output_path, 'rb') as wf:
-            print(f"🎵 WAV file: {wf.getnframes()} frames, {wf.getframerate()} Hz")
-            
-            # Create recognizer
-            rec = KaldiRecognizer(vosk_model, wf.getframerate())
-            rec.SetWords(True)
-            
-            # Process audio
-            while True:
-                data = wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                rec.AcceptWaveform(data)
-            
-            # Get result
-            result = json.loads(rec.FinalResult())
-            transcript = result.get("text", "").strip()
-            print(f"📝 Transcript: '{transcript}'")
-        
-        # Clean up temporary files
-        os.unlink(temp_input_path)
-        os.unlink(temp_output_path)
+        mode = data.get("mode") or RECOGNITION_MODE
+        transcript, stats = transcribe_samples(samples, mode=mode)
+        print(f"📝 Transcript: '{transcript}'")
+        print(f"⏱️ {stats['audio_seconds']}s audio -> {stats['speech_seconds']}s speech in "
+              f"{stats['segments']} segment(s), decoded in {stats['decode_seconds']}s")
         
-        return jsonify({"transcript": transcript})
+        return jsonify({"transcript": transcript, "stats": stats})
         
     except Exception as e:
         print(f"❌ Error in speech recognition: {str(e)}")
         return jsonify({"error": f"Speech recognition failed: {str(e)}"}), 500
 
+# --- Single round-trip voice turn ---
+# /converse takes the recording and streams NDJSON events back over one response:
+# the transcript, answer tokens as the model produces them, and synthesized audio for
+# each finished sentence. Generation and synthesis run in separate threads so the first
+# sentence is being spoken while the model is still writing the rest.
+# Titles are not sentence ends, so "Dr. Kumar teaches physics." is spoken as one chunk
+TITLE_ABBREVIATIONS = ("Dr", "Prof", "Mr", "Mrs", "Ms")
+SENTENCE_END = re.compile("".join(rf"(?<!\b{title}\.)" for title in TITLE_ABBREVIATIONS) + r"(?<=[.!?])\s+")
+
+def _request_audio_bytes():
+    if "audio" in request.files:
+        return request.files["audio"].read()
+    if request.is_json:
+        audio_data = (request.get_json() or {}).get("audio", "")
+        return base64.b64decode(audio_data.split(",")[-1]) if audio_data else b""
+    return request.get_data()
+
+def _request_field(name):
+    value = request.args.get(name) or request.form.get(name)
+    if value is None and request.is_json:
+        value = (request.get_json() or {}).get(name)
+    return value
+
+def _event(kind, **fields):
+    return json.dumps({"type": kind, **fields}) + "\n"
+
+def _generate_answer(question, history, state, events, sentences, cancelled):
+    """Producer stage: stream tokens to the client and complete sentences to TTS"""
+    pending = ""
+    parts = []
+    tokens = stream_gemma3_response(question, students.view, professors.view, history, state)
+    try:
+        for token in tokens:
+            if cancelled.is_set():
+                break
+            parts.append(token)
+            events.put(("token", {"text": token}))
+            pending += token
+            *complete, pending = SENTENCE_END.split(pending)
+            for sentence in complete:
+                sentences.put(sentence)
+        if pending.strip() and not cancelled.is_set():
+            sentences.put(pending)
+    finally:
+        # Closing the stream drops the model request and frees its tier slot
+        tokens.close()
+        sentences.put(None)
+        events.put(("answer", {"text": clean_response("".join(parts))}))
+
+def _synthesize_sentences(audio_format, events, sentences, cancelled):
+    """Consumer stage: synthesize each sentence as soon as it is complete"""
+    index = 0
+    try:
+        while True:
+            sentence = sentences.get()
+            if sentence is None or cancelled.is_set():
+                break
+            text = clean_response(sentence)
+            if not text:
+                continue
+            try:
+                encoded_format, payload = synthesize_audio(text, audio_format)
+            except Exception as e:
+                print("TTS error:", e)
+                continue
+            events.put(("audio", {"index": index, "text": text, "format": encoded_format,
+                                  "data": base64.b64encode(payload).decode("ascii")}))
+            index += 1
+    finally:
+        events.put(("tts_done", {"chunks": index}))
+
+@app.route("/converse", methods=["POST"])
+def converse():
+    if not vosk_model:
+        return jsonify({"error": "Vosk model not loaded"}), 500
+
+    session_id = _request_field("sessionId")
+    if not session_id:
+        return jsonify({"error": "Session ID is missing"}), 400
+    audio_bytes = _request_audio_bytes()
+    if not audio_bytes:
+        return jsonify({"error": "No audio data provided"}), 400
+
+    audio_format = negotiate_audio_format(_request_field("format"))
+    mode = _request_field("mode") or RECOGNITION_MODE
+
+    def run():
+        started = time.perf_counter()
+        try:
+            samples = decode_audio_bytes(audio_bytes)
+        except Exception as e:
+            print(f"❌ Audio conversion failed: {e}")
+            yield _event("error", error="Audio conversion failed")
+            return
+        transcript, stats = transcribe_samples(samples, mode=mode)
+        yield _event("transcript", text=transcript, stats=stats)
+        if not transcript:
+            yield _event("done", timings={"total_seconds": round(time.perf_counter() - started, 3)})
+            return
+
+        history, state = load_session(session_id)
+        events = queue.Queue()
+        sentences = queue.Queue()
+        cancelled = threading.Event()
+        threading.Thread(target=_generate_answer, args=(transcript, history, state, events, sentences, cancelled), daemon=True).start()
+        threading.Thread(target=_synthesize_sentences, args=(audio_format, events, sentences, cancelled), daemon=True).start()
+
+        answer = None
+        tts_finished = False
+        first_audio = None
+        try:
+            while answer is None or not tts_finished:
+                kind, fields = events.get()
+                if kind == "tts_done":
+                    tts_finished = True
+                    continue
+                if kind == "answer":
+                    answer = fields["text"]
+                elif kind == "audio" and first_audio is None:
+                    first_audio = time.perf_counter() - started
+                yield _event(kind, **fields)
+        finally:
+            # Set when the client disconnects mid-answer so both stages stop working for nobody
+            cancelled.set()
+
+        save_turn(session_id, transcript, answer, state)
+        yield _event("done", timings={
+            "first_audio_seconds": round(first_audio, 3) if first_audio is not None else None,
+            "total_seconds": round(time.perf_counter() - started, 3),
+        })
+
+    return Response(stream_with_context(run()), mimetype="application/x-ndjson")
+
+# --- Streaming recognition with speculative answers ---
+# The browser posts raw 16 kHz mono PCM16 chunks to /recognize/stream while the user
+# is still talking. Once the partial transcript has stopped changing (or Vosk reports
+# an endpoint) the answer is generated for it in the background. When the last chunk
+# arrives the speculative answer is used if the final transcript says the same thing,
+# otherwise it is cancelled and the answer is generated for the final transcript.
+SPECULATION_ENABLED = os.environ.get("JARVISHA_SPECULATION", "1") != "0"
+SPECULATION_STABLE_SECONDS = float(os.environ.get("JARVISHA_SPECULATION_STABLE_SECONDS", "0.4"))
+SPECULATION_WAIT_SECONDS = 60
+STREAM_IDLE_SECONDS = 30
+
+speculation_stats = SpeculationStats()
+stream_utterances = {}
+stream_utterances_lock = Lock()
+
+class StreamingUtterance:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.recognizer = KaldiRecognizer(vosk_model, VOSK_SAMPLE_RATE)
+        self.committed = []
+        self.text = ""
+        self.text_since = time.perf_counter()
+        self.speculation = None
+        self.state = None
+        self.last_seen = time.monotonic()
+        self.lock = Lock()
+
+    def accept(self, pcm):
+        """Feed a chunk; returns True when Vosk detected the end of a phrase"""
+        endpoint = self.recognizer.AcceptWaveform(pcm)
+        if endpoint:
+            self.committed.append(json.loads(self.recognizer.Result()).get("text", ""))
+            partial = ""
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        text = " ".join(part for part in self.committed + [partial] if part)
+        if text != self.text:
+            self.text = text
+            self.text_since = time.perf_counter()
+        return endpoint
+
+    def finish(self):
+        self.committed.append(json.loads(self.recognizer.FinalResult()).get("text", ""))
+        return " ".join(part for part in self.committed if part)
+
+    def speculate(self):
+        """Start (or restart) generation for the current partial transcript"""
+        current = self.speculation
+        if current is not None:
+            if current.matches(self.text) and not current.cancelled:
+                return
+            if not current.cancelled:
+                current.cancel()
+                speculation_stats.record_miss()
+            if not current.done:
+                # The abandoned generation still holds its model request until its next
+                # token; start the new one on a later chunk instead of stacking them up
+                return
+        history, self.state = load_session(self.session_id)
+        state = self.state
+        self.speculation = SpeculativeAnswer(
+            self.text,
+            # Failures must reach the speculation so they count as misses, not answers
+            lambda text: stream_gemma3_response(text, students.view, professors.view, history, state,
+                                                raise_errors=True),
+        )
+        speculation_stats.record_start()
+
+def _claim_utterance(utterance_id, session_id):
+    now = time.monotonic()
+    with stream_utterances_lock:
+        for key, stale in list(stream_utterances.items()):
+            if now - stale.last_seen > STREAM_IDLE_SECONDS:
+                if stale.speculation is not None:
+                    stale.speculation.cancel()
+                del stream_utterances[key]
+        utterance = stream_utterances.get(utterance_id)
+        if utterance is None:
+            utterance = stream_utterances[utterance_id] = StreamingUtterance(session_id)
+        utterance.last_seen = now
+    return utterance
+
+def _answer_final_transcript(utterance, transcript):
+    """Use the speculative answer if it still fits, otherwise cancel it and answer again"""
+    final_at = time.perf_counter()
+    speculation = utterance.speculation
+    if speculation is not None and not speculation.cancelled and speculation.matches(transcript):
+        answer = clean_response(speculation.result(SPECULATION_WAIT_SECONDS))
+        if speculation.error is None and speculation.finished_at is not None and answer:
+            saved = min(final_at, speculation.finished_at) - speculation.started
+            speculation_stats.record_hit(saved)
+            return answer, utterance.state, {"used": True, "saved_seconds": round(saved, 3)}
+    if speculation is not None and not speculation.cancelled:
+        speculation.cancel()
+        speculation_stats.record_miss()
+    history, state = load_session(utterance.session_id)
+    answer = get_gemma3_response(transcript, students.view, professors.view, history, state)
+    return answer, state, {"used": False, "saved_seconds": 0.0}
+
+@app.route("/recognize/stream", methods=["POST"])
+def recognize_stream():
+    if not vosk_model:
+        return jsonify({"error": "Vosk model not loaded"}), 500
+
+    utterance_id = request.args.get("utteranceId")
+    session_id = request.args.get("sessionId")
+    if not utterance_id or not session_id:
+        return jsonify({"error": "utteranceId and sessionId are required"}), 400
+    final = request.args.get("final") in ("1", "true")
+    pcm = request.get_data()
+
+    utterance = _claim_utterance(utterance_id, session_id)
+    with utterance.lock:
+        endpoint = utterance.accept(pcm) if pcm else False
+        stable = endpoint or time.perf_counter() - utterance.text_since >= SPECULATION_STABLE_SECONDS
+        if SPECULATION_ENABLED and not final and stable and utterance.text:
+            utterance.speculate()
+        if not final:
+            return jsonify({"partial": utterance.text, "speculating": utterance.speculation is not None and not utterance.speculation.cancelled})
+
+        with stream_utterances_lock:
+            stream_utterances.pop(utterance_id, None)
+        started = time.perf_counter()
+        transcript = utterance.finish()
+        print(f"📝 Transcript: '{transcript}'")
+        if not transcript:
+            if utterance.speculation is not None and not utterance.speculation.cancelled:
+                utterance.speculation.cancel()
+                speculation_stats.record_miss()
+            return jsonify({"transcript": "", "answer": None})
+        answer, state, speculation = _answer_final_transcript(utterance, transcript)
+        save_turn(session_id, transcript, answer, state)
+        speculation["answer_seconds"] = round(time.perf_counter() - started, 3)
+        return jsonify({"transcript": transcript, "answer": answer, "speculation": speculation})
+
+@app.route("/metrics/recognition", methods=["GET"])
+def recognition_metrics():
+    return jsonify(recognition_stats.snapshot())
+
+@app.route("/metrics/speculation", methods=["GET"])
+def speculation_metrics():
+    return jsonify(speculation_stats.snapshot())
+
 @app.route("/test", methods=["GET"])
 def test_tts():
     try:
-        tts.tts_to_file(
-            text="This is a test. The assistant voice is working perfectly.",
-            file_path=os.path.join(AUDIO_DIR, "output.wav")
-        )
+        # Through synthesize_audio so it waits its turn on tts_lock like /speak and /converse
+        _format, payload = synthesize_audio("This is a test. The assistant voice is working perfectly.", "wav")
+        write_legacy_audio_file(payload)
         return jsonify({"status": "TTS test complete"}), 200
     except Exception as e:
         print("TTS test error:", e)
@@ -407,79 +1277,138 @@ def start_react_frontend():
         print("Error starting frontend:", e)
 
 def start_flask_backend():
+    model_router.start_keep_warm(warm_model)
     app.run(debug=True, port=5000)
 
 # --- Admin API Endpoints ---
-student_data_lock = Lock()
-professor_data_lock = Lock()
+# Writers copy the current records, change the copy and commit it, which saves the
+# file and publishes a new view in one step under the roster's lock.
+
+# --- Bulk import ---
+# Parsing lives in bulk_import.py; this applies the parsed rows to a roster
+def bulk_upsert(roster):
+    """Upsert every valid row from the request body with a single save and index rebuild"""
+    key_fields = roster.key_fields
+    results = []
+    valid = []
+    malformed = False
+    for row, record, error in iter_bulk_records(request.stream, request.content_type or ""):
+        key = None
+        if error is None:
+            key, error = validate_bulk_record(record, key_fields)
+        else:
+            malformed = True
+        if error:
+            results.append({"row": row, "key": key, "status": "error", "error": error})
+        else:
+            valid.append((row, key, record))
 
-def save_data_to_json(file_path, data):
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    failed = len(results)
+    # Rows that fail validation are skipped; a body that doesn't parse rejects the whole batch
+    atomic = malformed or request.args.get("atomic", "").lower() in ("1", "true", "yes")
+    if not valid or (failed and atomic):
+        status = "rejected" if valid else "noop"
+        code = 400 if failed else 200
+        return jsonify({"status": status, "created": 0, "updated": 0, "failed": failed, "results": results}), code
+
+    created = updated = 0
+    with roster.lock:
+        records = list(roster.records)
+        positions = {}
+        for position, existing in enumerate(records):
+            existing_key = record_key(existing, key_fields) if isinstance(existing, Mapping) else None
+            if existing_key is not None:
+                positions[existing_key] = position
+        for row, key, record in valid:
+            position = positions.get(key)
+            if position is None:
+                positions[key] = len(records)
+                records.append(record)
+                created += 1
+                results.append({"row": row, "key": key, "status": "created"})
+            else:
+                records[position] = record
+                updated += 1
+                results.append({"row": row, "key": key, "status": "updated"})
+        roster.commit(records)
+
+    results.sort(key=lambda result: result["row"])
+    print(f"📥 Bulk import into {roster.file_path}: {created} created, {updated} updated, {failed} failed")
+    return jsonify({"status": "ok", "created": created, "updated": updated, "failed": failed, "results": results})
 
 @app.route('/api/students', methods=['GET'])
 def api_get_students():
-    return jsonify(student_data)
+    return jsonify(to_plain(students.records))
 
 @app.route('/api/students', methods=['POST'])
 def api_add_student():
     new_student = request.json
-    with student_data_lock:
-        student_data.append(new_student)
-        save_data_to_json(JSON_STUDENT_FILE, student_data)
+    with students.lock:
+        students.commit(students.records + [new_student])
     return jsonify({'status': 'ok', 'student': new_student}), 201
 
+@app.route('/api/students/bulk', methods=['POST'])
+def api_bulk_students():
+    return bulk_upsert(students)
+
 @app.route('/api/students/<int:index>', methods=['PUT'])
 def api_update_student(index):
     updated_student = request.json
-    with student_data_lock:
-        if 0 <= index < len(student_data):
-            student_data[index] = updated_student
-            save_data_to_json(JSON_STUDENT_FILE, student_data)
+    with students.lock:
+        records = list(students.records)
+        if 0 <= index < len(records):
+            records[index] = updated_student
+            students.commit(records)
             return jsonify({'status': 'ok', 'student': updated_student})
         else:
             return jsonify({'error': 'Student not found'}), 404
 
 @app.route('/api/students/<int:index>', methods=['DELETE'])
 def api_delete_student(index):
-    with student_data_lock:
-        if 0 <= index < len(student_data):
-            removed = student_data.pop(index)
-            save_data_to_json(JSON_STUDENT_FILE, student_data)
-            return jsonify({'status': 'ok', 'removed': removed})
+    with students.lock:
+        records = list(students.records)
+        if 0 <= index < len(records):
+            removed = records.pop(index)
+            students.commit(records)
+            return jsonify({'status': 'ok', 'removed': to_plain(removed)})
         else:
             return jsonify({'error': 'Student not found'}), 404
 
 @app.route('/api/professors', methods=['GET'])
 def api_get_professors():
-    return jsonify(professor_data)
+    return jsonify(to_plain(professors.records))
 
 @app.route('/api/professors', methods=['POST'])
 def api_add_professor():
     new_prof = request.json
-    with professor_data_lock:
-        professor_data.append(new_prof)
-        save_data_to_json(JSON_PROFESSOR_FILE, professor_data)
+    with professors.lock:
+        professors.commit(professors.records + [new_prof])
     return jsonify({'status': 'ok', 'professor': new_prof}), 201
 
+@app.route('/api/professors/bulk', methods=['POST'])
+def api_bulk_professors():
+    return bulk_upsert(professors)
+
 @app.route('/api/professors/<int:index>', methods=['PUT'])
 def api_update_professor(index):
     updated_prof = request.json
-    with professor_data_lock:
-        if 0 <= index < len(professor_data):
-            professor_data[index] = updated_prof
-            save_data_to_json(JSON_PROFESSOR_FILE, professor_data)
+    with professors.lock:
+        records = list(professors.records)
+        if 0 <= index < len(records):
+            records[index] = updated_prof
+            professors.commit(records)
             return jsonify({'status': 'ok', 'professor': updated_prof})
         else:
             return jsonify({'error': 'Professor not found'}), 404
 
 @app.route('/api/professors/<int:index>', methods=['DELETE'])
 def api_delete_professor(index):
-    with professor_data_lock:
-        if 0 <= index < len(professor_data):
-            removed = professor_data.pop(index)
-            save_data_to_json(JSON_PROFESSOR_FILE, professor_data)
-            return jsonify({'status': 'ok', 'removed': removed})
+    with professors.lock:
+        records = list(professors.records)
+        if 0 <= index < len(records):
+            removed = records.pop(index)
+            professors.commit(records)
+            return jsonify({'status': 'ok', 'removed': to_plain(removed)})
         else:
             return jsonify({'error': 'Professor not found'}), 404
 
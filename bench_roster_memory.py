@@ -0,0 +1,74 @@
+import json
+import random
+import sys
+import tracemalloc
+
+from roster import compact, render_records
+
+# Compares the memory a roster costs per record when held the old way (plain dicts
+# plus a cached pretty-printed dump for the prompt) and as CompactRecords.
+#
+#   python bench_roster_memory.py [record_count]
+
+FIRST_NAMES = ["Arun", "Priya", "Santhosh", "Dharshini", "Rohith", "Subash", "Kavya", "Manoj", "Divya", "Karthik"]
+LAST_NAMES = ["Kumar", "Raj", "Priya", "Lakshmi", "Krishnan", "Murugan", "Devi", "Ramesh"]
+CLASSES = [f"{dept} - {year} Year" for dept in ("Computer Science Engineering", "Electronics", "Mechanical", "Civil")
+           for year in ("1st", "2nd", "3rd", "4th")]
+REMARKS = [
+    "{} is a consistent performer and actively participates in class discussions.",
+    "{} needs improvement in time management and assignment submissions.",
+    "{} shows excellent leadership in team projects and presentations.",
+    "{} is improving steadily and shows great interest in labs.",
+]
+
+
+def make_students(count, seed=7):
+    rng = random.Random(seed)
+    students = []
+    for number in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        students.append({
+            "name": name,
+            "roll_no": str(511522100000 + number),
+            "gender": rng.choice(["Male", "Female"]),
+            "class": rng.choice(CLASSES),
+            "attendance": f"{rng.randint(60, 100)}%",
+            "marks": {"Math": rng.randint(40, 100), "Physics": rng.randint(40, 100), "Chemistry": rng.randint(40, 100)},
+            "remarks": rng.choice(REMARKS).format(name),
+        })
+    return students
+
+
+def retained_bytes(build):
+    """Bytes still allocated after build() returns, i.e. what the result keeps alive"""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = build()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return retained, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    text = json.dumps(make_students(count))
+
+    def before():
+        records = json.loads(text)
+        return records, json.dumps(records, indent=2)
+
+    def after():
+        return [compact(record) for record in json.loads(text)]
+
+    old_bytes, (old_records, _dump) = retained_bytes(before)
+    new_bytes, new_records = retained_bytes(after)
+    assert render_records(new_records) == json.dumps(old_records, indent=2)
+
+    print(f"Records: {count}")
+    print(f"Before (dicts + cached prompt dump): {old_bytes / count:8.1f} bytes/record  {old_bytes / 2**20:8.1f} MiB")
+    print(f"After  (CompactRecord, interned):    {new_bytes / count:8.1f} bytes/record  {new_bytes / 2**20:8.1f} MiB")
+    print(f"Saved: {100 * (1 - new_bytes / old_bytes):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
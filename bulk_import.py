@@ -0,0 +1,148 @@
+import codecs
+import json
+from itertools import chain
+
+from roster import record_key
+
+# Incremental parsing of bulk import bodies, either NDJSON (one record per line) or a
+# single JSON array of records. The body is read in BULK_CHUNK_SIZE pieces so a large
+# import never has to sit in memory as one string. Parsers yield (row, record, error);
+# an error from them means the body is not valid JSON, which rejects the whole batch.
+
+BULK_CHUNK_SIZE = 64 * 1024
+# A JSON-array parse error this far from the end of the buffer can't be fixed by reading more
+BULK_LOOKAHEAD = 16
+_json_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+def _read_text_chunks(stream, chunk_size=BULK_CHUNK_SIZE):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+
+
+def _decode_ndjson_line(row, line):
+    try:
+        return row, json.loads(line), None
+    except json.JSONDecodeError as e:
+        return row, None, f"Invalid JSON: {e.msg}"
+
+
+def _iter_ndjson(chunks):
+    row = 0
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                row += 1
+                yield _decode_ndjson_line(row, line)
+    if buffer.strip():
+        yield _decode_ndjson_line(row + 1, buffer)
+
+
+def _iter_json_array(buffer, chunks):
+    """Parse array items from buffer (positioned just after the opening bracket) onwards"""
+    row = 0
+    pos = 0
+    expect_item = True
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                yield row + 1, None, "Unterminated JSON array"
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        char = buffer[pos]
+        if char == "]" and (not expect_item or row == 0):
+            rest = buffer[pos + 1:]
+            while not rest.strip():
+                rest = next(chunks, None)
+                if rest is None:
+                    return
+            yield row + 1, None, "Unexpected data after JSON array"
+            return
+        if not expect_item:
+            # Exactly one comma between items
+            if char != ",":
+                yield row + 1, None, "Invalid JSON: Expecting ',' delimiter"
+                return
+            pos += 1
+            expect_item = True
+            continue
+        if char in ",]":
+            yield row + 1, None, "Invalid JSON: Expecting value"
+            return
+
+        try:
+            record, end = _json_decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # An error well before the end of what we have is not a chunk boundary (an
+            # unterminated string reports where it started, so it always could be)
+            if not e.msg.startswith("Unterminated string") and e.pos + BULK_LOOKAHEAD < len(buffer):
+                yield row + 1, None, f"Invalid JSON: {e.msg}"
+                return
+            chunk = next(chunks, None)
+            if chunk is None:
+                yield row + 1, None, f"Invalid JSON: {e.msg}"
+                return
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        if end == len(buffer):
+            # A number or literal that ends the buffer may continue in the next chunk
+            chunk = next(chunks, None)
+            if chunk is not None:
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+        row += 1
+        yield row, record, None
+        pos = end
+        expect_item = False
+
+
+def iter_bulk_records(stream, content_type="", chunk_size=BULK_CHUNK_SIZE):
+    """Parse an NDJSON or JSON-array body incrementally, yielding (row, record, error).
+
+    An error from here means the body itself is not valid JSON.
+    """
+    chunks = _read_text_chunks(stream, chunk_size)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if buffer.strip():
+            break
+    buffer = buffer.lstrip()
+    if not buffer:
+        return
+    if buffer[0] == "[" and "ndjson" not in content_type:
+        yield from _iter_json_array(buffer[1:], chunks)
+    else:
+        # The text read while sniffing the format is the start of the first line
+        yield from _iter_ndjson(chain((buffer,), chunks))
+
+
+def validate_bulk_record(record, key_fields):
+    """Return (key, error) for a single bulk row"""
+    if not isinstance(record, dict):
+        return None, "Record must be a JSON object"
+    if not str(record.get("name", "")).strip():
+        return None, "Missing 'name'"
+    key = record_key(record, key_fields)
+    if key is None:
+        return None, f"Missing key field ({' or '.join(key_fields)})"
+    return key, None
@@ -0,0 +1,94 @@
+import os
+import threading
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Calls on_change(path) when one of a few files changes on disk. Uses inotify (via
+# watchdog) when available and falls back to polling modification times.
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if path:
+                self.watcher.notify(os.path.abspath(path))
+
+
+class FileWatcher:
+    def __init__(self, paths, on_change, poll_interval=2.0, debounce=0.3):
+        self.paths = {os.path.abspath(path) for path in paths}
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+
+    def start(self):
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                handler = _Handler(self)
+                for directory in {os.path.dirname(path) for path in self.paths}:
+                    self._observer.schedule(handler, directory, recursive=False)
+                self._observer.daemon = True
+                self._observer.start()
+                print("👀 Watching data files with inotify")
+                return
+            except Exception as e:
+                print(f"⚠️ inotify watcher unavailable, polling instead: {e}")
+                self._observer = None
+        threading.Thread(target=self._poll_loop, name="file-watcher", daemon=True).start()
+        print(f"👀 Polling data files every {self.poll_interval}s")
+
+    def notify(self, path):
+        """Schedule a change callback, collapsing the burst of events an editor save produces"""
+        if path not in self.paths:
+            return
+        with self._lock:
+            timer = self._timers.get(path)
+            if timer:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, self._fire, args=(path,))
+            timer.daemon = True
+            self._timers[path] = timer
+            timer.start()
+
+    def _fire(self, path):
+        with self._lock:
+            self._timers.pop(path, None)
+        try:
+            self.on_change(path)
+        except Exception as e:
+            print(f"❌ Reload of {path} failed: {e}")
+
+    def _poll_loop(self):
+        signatures = {path: self._signature(path) for path in self.paths}
+        while not self._stop.wait(self.poll_interval):
+            for path in self.paths:
+                signature = self._signature(path)
+                if signature != signatures[path]:
+                    signatures[path] = signature
+                    self._fire(path)
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def stop(self):
+        self._stop.set()
+        if self._observer:
+            self._observer.stop()
@@ -35,6 +35,14 @@ function TypingBubble({ text, isUser, animate, onDone }) {
   );
 }
 
+// Ask for the smallest format this browser can play; WAV is the last resort
+function preferredAudioFormat() {
+  const probe = document.createElement('audio');
+  if (probe.canPlayType('audio/ogg; codecs="opus"')) return 'ogg';
+  if (probe.canPlayType('audio/mpeg')) return 'mp3';
+  return 'wav';
+}
+
 function App() {
   const [lines, setLines] = useState([]); // {text, isUser}
   const [pending, setPending] = useState(null); // for animating
@@ -98,12 +106,14 @@ function App() {
   const speakAnswer = async (text) => {
     setIsSpeaking(true);
     if (isListening) stopListening();
-    await fetch("http://localhost:5000/speak", {
+    const res = await fetch("http://localhost:5000/speak", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ text }),
+      body: JSON.stringify({ text, format: preferredAudioFormat() }),
     });
-    audioRef.current = new Audio(`http://localhost:5000/audio/output.wav?t=${Date.now()}`);
+    const data = await res.json();
+    const file = data.file || 'output.wav';
+    audioRef.current = new Audio(`http://localhost:5000/audio/${file}?t=${Date.now()}`);
     audioRef.current.play();
     audioRef.current.onended = () => {
       setIsSpeaking(false);
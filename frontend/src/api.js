@@ -18,3 +18,57 @@ export async function updateProfessor(id, data) {
   return await axios.post(`${BASE_URL}/professor/${id}`, data);
 }
 
+
+// One voice turn over a single request: posts the recording to /converse and calls
+// onEvent for each streamed event (transcript, token, audio, answer, done).
+export async function converse(audioBlob, sessionId, onEvent, format = "ogg") {
+  const params = new URLSearchParams({ sessionId, format });
+  const res = await fetch(`${BASE_URL}/converse?${params}`, {
+    method: "POST",
+    headers: { "Content-Type": audioBlob.type || "application/octet-stream" },
+    body: audioBlob,
+  });
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split("\n");
+    buffer = lines.pop();
+    lines.filter(line => line.trim()).forEach(line => onEvent(JSON.parse(line)));
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer));
+}
+
+// Streaming recognition: push 16 kHz mono Int16Array chunks while the user speaks so
+// the backend can start answering the settled partial transcript early. finish()
+// resolves with { transcript, answer, speculation } once the utterance is final.
+// Not used by App.jsx yet, which still recognises speech in the browser; a caller
+// needs its own PCM capture (e.g. an AudioWorklet resampling to 16 kHz).
+export function streamRecognition(sessionId) {
+  const utteranceId = `${sessionId}-${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
+  let pending = Promise.resolve();
+  const post = (chunk, final) => {
+    const params = new URLSearchParams({ sessionId, utteranceId, final: final ? "1" : "0" });
+    return fetch(`${BASE_URL}/recognize/stream?${params}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/octet-stream" },
+      body: chunk,
+    }).then(res => res.json());
+  };
+  return {
+    // Chunks are sent one after another so the recognizer sees the audio in order
+    push(samples, onPartial) {
+      pending = pending.then(() => post(samples.buffer, false)).then(result => {
+        if (onPartial) onPartial(result);
+      });
+      return pending;
+    },
+    finish(samples = new Int16Array(0)) {
+      pending = pending.then(() => post(samples.buffer, true));
+      return pending;
+    },
+  };
+}
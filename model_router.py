@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Routes each query class to a model tier, keeps the tier models resident with a
+# periodic keep-warm ping, and steps down to a smaller tier when the preferred one
+# is saturated, has recently been slow, or its model could not be reached. Per-tier
+# latency and volume are recorded.
+
+LATENCY_WINDOW = 200
+# A tier skipped for being slow or unavailable is retried after this long so it can recover
+SLOW_PROBE_SECONDS = 30
+
+
+class Tier:
+    def __init__(self, name, model, max_concurrent=1, slow_seconds=None):
+        self.name = name
+        self.model = model
+        self.max_concurrent = max_concurrent
+        self.slow_seconds = slow_seconds
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.fallbacks = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.first_token = deque(maxlen=LATENCY_WINDOW)
+        self.ewma = None
+        self.last_started = 0.0
+        self.unavailable_until = 0.0
+
+    def record(self, seconds, alpha=0.2):
+        self.latencies.append(seconds)
+        self.ewma = seconds if self.ewma is None else alpha * seconds + (1 - alpha) * self.ewma
+
+    def available(self):
+        if self.in_flight >= self.max_concurrent or time.monotonic() < self.unavailable_until:
+            return False
+        if self.slow_seconds is None or self.ewma is None or self.ewma <= self.slow_seconds:
+            return True
+        return time.monotonic() - self.last_started >= SLOW_PROBE_SECONDS
+
+
+class Lease:
+    """The tier a request was routed to, plus its timing"""
+
+    def __init__(self, tier, query_class):
+        self.tier = tier
+        self.model = tier.model
+        self.query_class = query_class
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class ModelRouter:
+    def __init__(self, tiers, routes, fallbacks, keep_alive="30m", warm_interval=240):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.routes = routes
+        self.fallbacks = fallbacks
+        self.keep_alive = keep_alive
+        self.warm_interval = warm_interval
+        self._lock = threading.Lock()
+        self._classes = {}
+
+    def _pick(self, query_class, skip):
+        preferred = self.tiers[self.routes.get(query_class, next(iter(self.tiers)))]
+        tier = preferred
+        # Walk down the fallback chain until a tier has room; use the last one regardless
+        while (tier.name in skip or not tier.available()) and tier.name in self.fallbacks:
+            tier = self.tiers[self.fallbacks[tier.name]]
+        if tier is not preferred:
+            preferred.fallbacks += 1
+        return tier
+
+    @contextmanager
+    def use(self, query_class, skip=()):
+        """Lease a tier for query_class, passing over the tiers named in skip"""
+        with self._lock:
+            tier = self._pick(query_class, skip)
+            tier.in_flight += 1
+            tier.requests += 1
+            tier.last_started = time.monotonic()
+            self._classes[query_class] = self._classes.get(query_class, 0) + 1
+        lease = Lease(tier, query_class)
+        try:
+            yield lease
+        except Exception:
+            with self._lock:
+                tier.errors += 1
+            raise
+        else:
+            finished = time.perf_counter()
+            with self._lock:
+                tier.record(finished - lease.started)
+                if lease.first_token_at is not None:
+                    tier.first_token.append(lease.first_token_at - lease.started)
+        finally:
+            with self._lock:
+                tier.in_flight -= 1
+
+    def has_fallback(self, lease):
+        return lease.tier.name in self.fallbacks
+
+    def mark_unavailable(self, lease):
+        """Route around a tier whose model could not be reached, until it is probed again"""
+        with self._lock:
+            lease.tier.unavailable_until = time.monotonic() + SLOW_PROBE_SECONDS
+
+    def start_keep_warm(self, warm):
+        """Call warm(model) for every tier now and then every warm_interval seconds"""
+        def loop():
+            while True:
+                for tier in self.tiers.values():
+                    try:
+                        warm(tier.model)
+                    except Exception as e:
+                        print(f"⚠️ Keep-warm for {tier.model} failed: {e}")
+                time.sleep(self.warm_interval)
+
+        threading.Thread(target=loop, name="model-keep-warm", daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "classes": dict(self._classes),
+                "tiers": {
+                    tier.name: {
+                        "model": tier.model,
+                        "requests": tier.requests,
+                        "in_flight": tier.in_flight,
+                        "errors": tier.errors,
+                        "fallbacks": tier.fallbacks,
+                        "latency_p50": _percentile(tier.latencies, 0.5),
+                        "latency_p95": _percentile(tier.latencies, 0.95),
+                        "first_token_p50": _percentile(tier.first_token, 0.5),
+                    }
+                    for tier in self.tiers.values()
+                },
+            }
@@ -0,0 +1,326 @@
+import json
+import os
+import re
+import sys
+import threading
+from collections.abc import Mapping
+
+# A roster is a JSON-backed list of records published as immutable views. Writers
+# build a new view next to the current one (reusing whatever was already derived for
+# unchanged records) and swap it in with a single assignment, so a request always
+# sees one complete version of the data and its indexes.
+#
+# Records are held as CompactRecords: a field-name tuple shared by every record with
+# the same fields plus a tuple of values, with short repeated strings (subjects,
+# genders, classes, attendance figures) interned. Prompt text is rendered when a
+# prompt is built instead of being cached alongside the records.
+
+NAME_TITLES = {"dr", "doctor", "prof", "professor", "mr", "mrs", "ms"}
+INTERN_MAX_LEN = 32
+
+
+class Schema:
+    __slots__ = ("fields", "positions")
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.positions = {field: position for position, field in enumerate(fields)}
+
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def _schema_for(fields):
+    schema = _schemas.get(fields)
+    if schema is None:
+        with _schemas_lock:
+            schema = _schemas.setdefault(fields, Schema(tuple(sys.intern(field) for field in fields)))
+    return schema
+
+
+class CompactRecord(Mapping):
+    """Read-only record stored as a shared schema plus a tuple of values"""
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema, values):
+        self._schema = schema
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._schema.positions[key]]
+
+    def get(self, key, default=None):
+        position = self._schema.positions.get(key)
+        return default if position is None else self._values[position]
+
+    def __contains__(self, key):
+        return key in self._schema.positions
+
+    def __iter__(self):
+        return iter(self._schema.fields)
+
+    def __len__(self):
+        return len(self._values)
+
+    def to_dict(self):
+        return {field: to_plain(value) for field, value in zip(self._schema.fields, self._values)}
+
+    def __repr__(self):
+        return f"CompactRecord({self.to_dict()!r})"
+
+
+def compact(value):
+    """Convert parsed JSON into CompactRecords with short strings interned"""
+    if isinstance(value, CompactRecord):
+        return value
+    if isinstance(value, dict):
+        schema = _schema_for(tuple(value.keys()))
+        return CompactRecord(schema, tuple(compact(item) for item in value.values()))
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    if isinstance(value, str) and len(value) <= INTERN_MAX_LEN:
+        return sys.intern(value)
+    return value
+
+
+def to_plain(value):
+    """Turn CompactRecords back into dicts for JSON responses"""
+    if isinstance(value, CompactRecord):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def render_records(records):
+    """Render records exactly as json.dumps(list_of_dicts, indent=2) would"""
+    return json.dumps(records, indent=2, default=to_plain)
+
+
+def load_records(file_path):
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return [] # Return empty list on error
+
+
+def save_records(file_path, records):
+    # Write to a sibling temp file and swap it in so readers never see a half-written roster
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(records, f, indent=2, default=to_plain)
+    os.replace(temp_path, file_path)
+
+
+def file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def entity_words(text):
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+
+def record_key(record, key_fields):
+    """Return the value used to upsert a record, or None if it has no key field"""
+    for field in key_fields:
+        value = record.get(field)
+        if isinstance(value, (str, int)) and str(value).strip():
+            return str(value).strip()
+    return None
+
+
+class NameIndex:
+    """Phrase -> record lookup that is patched per record instead of rebuilt.
+
+    Full names and aliases always resolve (the latest record wins); single words
+    taken from multi-word names only resolve while exactly one record uses them.
+    """
+
+    def __init__(self, alias_fields=()):
+        self.alias_fields = alias_fields
+        self.phrases = {}
+        self.words = {}
+
+    def copy(self):
+        index = NameIndex(self.alias_fields)
+        index.phrases = dict(self.phrases)
+        index.words = dict(self.words)
+        return index
+
+    def _entries(self, record):
+        if not isinstance(record, Mapping) or not record.get("name"):
+            return None, (), ()
+        name = record["name"]
+        words = [word for word in entity_words(name) if word not in NAME_TITLES]
+        phrases = {" ".join(entity_words(phrase))
+                   for phrase in [name] + [record.get(field) for field in self.alias_fields] if phrase}
+        if words:
+            phrases.add(" ".join(words))
+        phrases.discard("")
+        singles = {word for word in words if len(word) >= 4} if len(words) > 1 else set()
+        return name, phrases, singles
+
+    def add(self, record):
+        _name, phrases, singles = self._entries(record)
+        for phrase in phrases:
+            self.phrases[phrase] = self.phrases.get(phrase, ()) + (record,)
+        for word in singles:
+            self.words[word] = self.words.get(word, ()) + (record,)
+
+    def remove(self, record):
+        _name, phrases, singles = self._entries(record)
+        for table, keys in ((self.phrases, phrases), (self.words, singles)):
+            for key in keys:
+                owners = tuple(owner for owner in table.get(key, ()) if owner is not record)
+                if owners:
+                    table[key] = owners
+                else:
+                    table.pop(key, None)
+
+    def record(self, phrase):
+        """Return the record a phrase refers to, or None"""
+        owners = self.phrases.get(phrase)
+        if owners:
+            return owners[-1]
+        owners = self.words.get(phrase)
+        if owners and len(owners) == 1:
+            return owners[0]
+        return None
+
+    def get(self, phrase, default=None):
+        record = self.record(phrase)
+        return default if record is None else record["name"]
+
+    def keys(self):
+        return self.phrases.keys()
+
+
+class RosterView:
+    """One published version of a roster and everything derived from it"""
+
+    __slots__ = ("records", "names")
+
+    def __init__(self, records, names):
+        self.records = records
+        self.names = names
+
+    def find(self, name):
+        """Return the record for a name or alias, or None"""
+        return self.names.record(" ".join(entity_words(name))) if name else None
+
+
+class Roster:
+    def __init__(self, file_path, key_fields, alias_fields=(), on_publish=None):
+        self.file_path = file_path
+        self.key_fields = key_fields
+        self.alias_fields = alias_fields
+        self.on_publish = on_publish
+        # Serialises writers; readers just take self.view
+        self.lock = threading.Lock()
+        self.signature = file_signature(file_path)
+        self.view = self._build(load_records(file_path), None)
+
+    @property
+    def records(self):
+        return self.view.records
+
+    def _build(self, records, previous):
+        if previous is None:
+            names = NameIndex(self.alias_fields)
+            old_records = []
+        else:
+            names = previous.names.copy()
+            old_records = previous.records
+        new_ids = {id(record) for record in records}
+        old_ids = {id(record) for record in old_records}
+
+        for record in old_records:
+            if id(record) not in new_ids:
+                names.remove(record)
+        published = []
+        for record in records:
+            if id(record) not in old_ids:
+                record = compact(record)
+                names.add(record)
+            published.append(record)
+        return RosterView(published, names)
+
+    def publish(self, records):
+        """Swap in a new list of records; call with self.lock held"""
+        self.view = self._build(records, self.view)
+        if self.on_publish:
+            self.on_publish(self.view)
+
+    def commit(self, records):
+        """Persist and publish a new list of records; call with self.lock held"""
+        save_records(self.file_path, records)
+        self.signature = file_signature(self.file_path)
+        self.publish(records)
+
+    def _identity(self, record):
+        if not isinstance(record, Mapping):
+            return None
+        key = record_key(record, self.key_fields)
+        if key is not None:
+            return ("key", key)
+        if record.get("name"):
+            return ("name", record["name"])
+        return None
+
+    def reload_from_disk(self):
+        """Apply only the records that changed on disk; returns a summary or None if nothing changed"""
+        signature = file_signature(self.file_path)
+        if signature is None or signature == self.signature:
+            return None
+        try:
+            with open(self.file_path, 'r') as f:
+                loaded = json.load(f)
+        except (OSError, ValueError) as e:
+            # Usually an editor mid-save; the next change event will retry
+            print(f"⚠️ Ignoring {self.file_path} until it parses: {e}")
+            return None
+        if not isinstance(loaded, list):
+            print(f"⚠️ Ignoring {self.file_path}: expected a JSON list of records")
+            return None
+
+        with self.lock:
+            # A commit() or another edit may have landed since the file was read; the
+            # content parsed above is stale then, and the next change event retries
+            if self.signature == signature or file_signature(self.file_path) != signature:
+                return None
+            current = {}
+            for record in self.view.records:
+                identity = self._identity(record)
+                if identity is not None:
+                    current[identity] = record
+
+            merged = []
+            seen = set()
+            added = changed = 0
+            for record in loaded:
+                identity = self._identity(record)
+                existing = current.get(identity) if identity is not None else None
+                if existing is not None and identity not in seen and existing == record:
+                    merged.append(existing)
+                elif existing is None:
+                    merged.append(record)
+                    added += 1
+                else:
+                    merged.append(record)
+                    changed += 1
+                seen.add(identity)
+            removed = sum(1 for identity in current if identity not in seen)
+
+            self.signature = signature
+            unchanged = [id(record) for record in merged] == [id(record) for record in self.view.records]
+            if unchanged:
+                return None
+            self.publish(merged)
+        return {"added": added, "changed": changed, "removed": removed, "total": len(merged)}
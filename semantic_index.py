@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    from pynndescent import NNDescent
+except ImportError:
+    NNDescent = None
+
+# Offline semantic search over the free-text parts of the roster (remarks,
+# backgrounds, office hours). Vectors live in one NumPy matrix searched by dot
+# product; above ANN_THRESHOLD documents an approximate nearest-neighbour graph is
+# used instead. The index is persisted next to the data and only documents whose
+# text changed are re-embedded.
+#
+# The graph is built on a background thread and never patched in place. After a sync
+# the existing graph keeps serving the documents it already covers, and new or
+# changed documents are scored exactly next to it, until enough of them pile up to
+# be worth a rebuild.
+
+ANN_THRESHOLD = 20000
+# Rebuild the graph once this share of documents is missing from it or stale in it
+ANN_REBUILD_FRACTION = 0.05
+ANN_REBUILD_MIN = 1000
+
+
+class Embedder:
+    """Mean-pooled, L2-normalised sentence embeddings from a local transformers model"""
+
+    def __init__(self, model_path, device="cpu", batch_size=32):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.device = device
+        self.batch_size = batch_size
+        self.name = os.path.basename(os.path.normpath(model_path))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        self.model = AutoModel.from_pretrained(model_path, local_files_only=True).to(device).eval()
+        self.dimension = self.model.config.hidden_size
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            # Locked per batch so a query embeds between the batches of a long sync
+            with self._lock, self.torch.inference_mode():
+                batch = self.tokenizer(texts[start:start + self.batch_size], padding=True, truncation=True,
+                                       max_length=256, return_tensors="pt").to(self.device)
+                hidden = self.model(**batch).last_hidden_state
+                mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                vectors.append(self.torch.nn.functional.normalize(pooled, dim=1).cpu().numpy())
+        return np.vstack(vectors).astype(np.float32)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+_NO_POSITIONS = np.zeros(0, dtype=np.int64)
+
+
+class _State:
+    """One published version of the index.
+
+    ann_positions maps each graph node to its row in vectors (-1 once the document
+    was removed or changed); fresh lists the rows the graph does not cover.
+    """
+
+    __slots__ = ("keys", "hashes", "texts", "vectors", "ann", "ann_positions", "fresh")
+
+    def __init__(self, keys, hashes, texts, vectors, ann=None, ann_positions=_NO_POSITIONS, fresh=_NO_POSITIONS):
+        self.keys = keys
+        self.hashes = hashes
+        self.texts = texts
+        self.vectors = vectors
+        self.ann = ann
+        self.ann_positions = ann_positions
+        self.fresh = fresh
+
+    def graph_is_stale(self, threshold):
+        if len(self.keys) < threshold:
+            return False
+        if self.ann is None:
+            return True
+        drift = len(self.fresh) + int(np.count_nonzero(self.ann_positions < 0))
+        return drift >= max(ANN_REBUILD_MIN, ANN_REBUILD_FRACTION * len(self.keys))
+
+
+class SemanticIndex:
+    def __init__(self, embedder, path, ann_threshold=ANN_THRESHOLD):
+        self.embedder = embedder
+        self.path = path
+        self.ann_threshold = ann_threshold
+        self._sync_lock = threading.Lock()
+        self._ann_building = False
+        self._state = _State([], [], [], np.zeros((0, embedder.dimension), dtype=np.float32))
+        self.load()
+
+    def __len__(self):
+        return len(self._state.keys)
+
+    def load(self):
+        try:
+            with np.load(self.path) as stored:
+                meta = json.loads(str(stored["meta"]))
+                vectors = stored["vectors"]
+        except (OSError, KeyError, ValueError) as e:
+            if os.path.exists(self.path):
+                print(f"⚠️ Could not read semantic index, rebuilding: {e}")
+            return
+        if meta.get("model") != self.embedder.name or vectors.shape[1:] != (self.embedder.dimension,):
+            print("⚠️ Semantic index was built with a different model, rebuilding")
+            return
+        with self._sync_lock:
+            self._state = _State(meta["keys"], meta["hashes"], meta["texts"], vectors)
+            self._schedule_ann()
+        print(f"✅ Loaded semantic index with {len(meta['keys'])} documents")
+
+    def save(self):
+        state = self._state
+        meta = {"model": self.embedder.name, "keys": state.keys, "hashes": state.hashes, "texts": state.texts}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, vectors=state.vectors, meta=np.array(json.dumps(meta)))
+        os.replace(temp_path, self.path)
+
+    def _schedule_ann(self):
+        """Start a background graph build if the current one is missing or stale; call with _sync_lock held"""
+        if NNDescent is None or self._ann_building or not self._state.graph_is_stale(self.ann_threshold):
+            return
+        self._ann_building = True
+        threading.Thread(target=self._build_ann, args=(self._state,), name="semantic-ann", daemon=True).start()
+
+    def _build_ann(self, snapshot):
+        try:
+            ann = NNDescent(snapshot.vectors, metric="cosine")
+        except Exception as e:
+            print(f"❌ Semantic graph build failed, using exact search: {e}")
+            with self._sync_lock:
+                self._ann_building = False
+            return
+        with self._sync_lock:
+            # Syncs may have landed during the build; point the graph at the rows as they are now
+            state = self._state
+            positions = {key: position for position, key in enumerate(state.keys)}
+            ann_positions = np.full(len(snapshot.keys), -1, dtype=np.int64)
+            for node, key in enumerate(snapshot.keys):
+                position = positions.get(key)
+                if position is not None and state.hashes[position] == snapshot.hashes[node]:
+                    ann_positions[node] = position
+            covered = np.zeros(len(state.keys), dtype=bool)
+            covered[ann_positions[ann_positions >= 0]] = True
+            self._state = _State(state.keys, state.hashes, state.texts, state.vectors,
+                                 ann, ann_positions, np.flatnonzero(~covered))
+            self._ann_building = False
+            self._schedule_ann()
+
+    def sync(self, documents):
+        """Bring the index in line with documents (key -> text), embedding only new or changed text"""
+        with self._sync_lock:
+            state = self._state
+            digests = {key: _digest(text) for key, text in documents.items()}
+            positions = {key: position for position, key in enumerate(state.keys)}
+
+            kept = [position for position, key in enumerate(state.keys)
+                    if digests.get(key) == state.hashes[position]]
+            changed = [key for key in documents
+                       if key not in positions or state.hashes[positions[key]] != digests[key]]
+            if not changed and len(kept) == len(state.keys):
+                return 0
+
+            new_vectors = self.embedder.embed([documents[key] for key in changed])
+            keys = [state.keys[position] for position in kept] + changed
+            vectors = np.vstack([state.vectors[kept], new_vectors]) if keys else state.vectors[:0]
+
+            # Carry the graph over: kept rows move to their new positions, the rest drop out
+            moved = np.full(len(state.keys), -1, dtype=np.int64)
+            moved[kept] = np.arange(len(kept))
+            ann_positions = state.ann_positions
+            fresh = np.arange(len(kept), len(keys))
+            if state.ann is not None:
+                ann_positions = np.where(ann_positions >= 0, moved[ann_positions], -1)
+                carried = moved[state.fresh]
+                fresh = np.concatenate([carried[carried >= 0], fresh])
+            self._state = _State(
+                keys,
+                [state.hashes[position] for position in kept] + [digests[key] for key in changed],
+                [state.texts[position] for position in kept] + [documents[key] for key in changed],
+                vectors,
+                state.ann,
+                ann_positions,
+                fresh,
+            )
+            self._schedule_ann()
+            self.save()
+            return len(changed)
+
+    def search(self, query, k=3, min_score=0.0):
+        """Return up to k (key, text, score) hits, best first"""
+        state = self._state
+        if not state.keys or not query.strip():
+            return []
+        vector = self.embedder.embed([query])[0]
+        k = min(k, len(state.keys))
+        if state.ann is not None:
+            # Ask the graph for spare neighbours since some may be stale, then add the uncovered rows
+            nodes = state.ann.query(vector[None, :], k=min(len(state.ann_positions), 2 * k + 10))[0][0]
+            graph_hits = state.ann_positions[nodes]
+            candidates = np.unique(np.concatenate([graph_hits[graph_hits >= 0], state.fresh]))
+        elif len(state.keys) > k:
+            candidates = np.argpartition(-(state.vectors @ vector), k - 1)[:k]
+        else:
+            candidates = np.arange(len(state.keys))
+        scores = state.vectors[candidates] @ vector
+        order = np.argsort(-scores)[:k]
+        return [(state.keys[candidates[i]], state.texts[candidates[i]], float(scores[i]))
+                for i in order if scores[i] >= min_score]
@@ -0,0 +1,221 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Sessions live in memory, sharded so unrelated sessions never wait on the same lock,
+# and are written behind to SQLite in batches. Any process pointed at the same
+# database file can serve any session: entries are loaded lazily on first access.
+# In shared mode a read reloads the session if another process stored a newer
+# version, and a write (session(..., write=True)) runs inside one SQLite write
+# transaction that reloads first and writes the change straight through, so two
+# workers serving the same session never overwrite each other's turns.
+
+_UPSERT = (
+    "INSERT INTO sessions (id, data, version) VALUES (?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, version = excluded.version "
+    "WHERE excluded.version >= sessions.version"
+)
+
+
+class Session:
+    """One conversation's data plus the lock that serialises access to it"""
+
+    __slots__ = ("session_id", "data", "version", "lock", "loaded", "dirty", "evicted", "last_access")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.data = {}
+        self.version = 0
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.dirty = False
+        self.evicted = False
+        self.last_access = time.monotonic()
+
+    def touch(self):
+        """Mark the session as changed so the next flush persists it"""
+        self.dirty = True
+        self.version = time.time_ns()
+
+
+class _Shard:
+    __slots__ = ("lock", "sessions", "dirty")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.dirty = {}
+
+
+class SessionStore:
+    def __init__(self, path, shards=16, flush_interval=1.0, shared=False, idle_seconds=3600):
+        self.path = path
+        self.shared = shared
+        self.flush_interval = flush_interval
+        self.idle_seconds = idle_seconds
+        self._shards = [_Shard() for _ in range(shards)]
+        self._local = threading.local()
+        self._flush_lock = threading.Lock()
+
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL)"
+        )
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers run alongside the flusher
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    def _shard(self, session_id):
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    @contextmanager
+    def session(self, session_id, write=False):
+        """Hold a session's lock for the duration of the block, loading it if needed.
+
+        Pass write=True for blocks that change the session; in shared mode only those
+        take the database write lock.
+        """
+        shard = self._shard(session_id)
+        while True:
+            with shard.lock:
+                session = shard.sessions.get(session_id)
+                if session is None:
+                    session = shard.sessions[session_id] = Session(session_id)
+            with session.lock:
+                if session.evicted:
+                    # Dropped from memory while we were waiting; fetch a fresh entry
+                    continue
+                session.last_access = time.monotonic()
+                try:
+                    if self.shared and write:
+                        with self._write_through(session):
+                            yield session
+                    else:
+                        if not session.loaded or (self.shared and not session.dirty and self._stored_version(session_id) > session.version):
+                            self._load(session)
+                        yield session
+                finally:
+                    if session.dirty:
+                        with shard.lock:
+                            shard.dirty[session_id] = session
+                return
+
+    @contextmanager
+    def _write_through(self, session):
+        """Reload, use and persist a session under the database write lock shared by every process"""
+        db = self._connection()
+        owner = not db.in_transaction
+        if owner:
+            db.execute("BEGIN IMMEDIATE")
+        try:
+            stored = self._stored_version(session.session_id)
+            if not session.loaded or stored > session.version:
+                self._load(session)
+            yield session
+        except BaseException:
+            if owner:
+                db.execute("ROLLBACK")
+            raise
+        try:
+            if session.dirty:
+                session.version = max(session.version, stored + 1)
+                db.execute(_UPSERT, (session.session_id, json.dumps(session.data), session.version))
+            if owner:
+                db.execute("COMMIT")
+                session.dirty = False
+        except sqlite3.Error as e:
+            if owner and db.in_transaction:
+                db.execute("ROLLBACK")
+            # Left dirty, so the flusher retries it
+            print(f"❌ Session write failed, will retry: {e}")
+
+    def _stored_version(self, session_id):
+        row = self._connection().execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, session):
+        row = self._connection().execute(
+            "SELECT data, version FROM sessions WHERE id = ?", (session.session_id,)
+        ).fetchone()
+        if row:
+            session.data = json.loads(row[0])
+            session.version = row[1]
+        session.loaded = True
+
+    def flush(self):
+        """Write every dirty session to the database in a single transaction"""
+        with self._flush_lock:
+            pending = []
+            for shard in self._shards:
+                with shard.lock:
+                    dirty, shard.dirty = shard.dirty, {}
+                pending.extend(dirty.values())
+            if not pending:
+                return 0
+
+            rows = []
+            for session in pending:
+                with session.lock:
+                    rows.append((session.session_id, json.dumps(session.data), session.version))
+                    session.dirty = False
+
+            db = self._connection()
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                # Last writer wins across processes, judged by the time of the change
+                db.executemany(_UPSERT, rows)
+                db.execute("COMMIT")
+            except sqlite3.Error as e:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                print(f"❌ Session flush failed, will retry: {e}")
+                for session in pending:
+                    with session.lock:
+                        session.dirty = True
+                    shard = self._shard(session.session_id)
+                    with shard.lock:
+                        shard.dirty.setdefault(session.session_id, session)
+                return 0
+            return len(rows)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for shard in self._shards:
+            with shard.lock:
+                for session_id, session in list(shard.sessions.items()):
+                    if session.last_access > cutoff or session.dirty or session_id in shard.dirty:
+                        continue
+                    # Skip sessions that are in use right now
+                    if session.lock.acquire(blocking=False):
+                        try:
+                            session.evicted = True
+                            del shard.sessions[session_id]
+                        finally:
+                            session.lock.release()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self._evict_idle()
+            except Exception as e:
+                print(f"❌ Session store maintenance failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,104 @@
+import re
+import threading
+import time
+
+# Speculative answering: once the partial transcript of a streaming recognition has
+# settled, answer generation starts on it in the background. When the final
+# transcript arrives the work is kept if it still says the same thing, and cancelled
+# and redone otherwise.
+
+FILLER_WORDS = {"uh", "um", "erm", "hmm", "ah", "eh"}
+
+
+def normalize_transcript(text):
+    """Reduce a transcript to the words that change its meaning"""
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+class SpeculativeAnswer:
+    """Runs produce(transcript) in a background thread, collecting its text until cancelled"""
+
+    def __init__(self, transcript, produce):
+        self.transcript = transcript
+        self.key = normalize_transcript(transcript)
+        self.started = time.perf_counter()
+        self.finished_at = None
+        self.error = None
+        self._parts = []
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(produce,), name="speculation", daemon=True).start()
+
+    def _run(self, produce):
+        chunks = None
+        try:
+            chunks = produce(self.transcript)
+            for chunk in chunks:
+                if self._cancel.is_set():
+                    break
+                self._parts.append(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            # A cancel is only seen once the next chunk arrives; closing the generator then
+            # drops the model stream and frees its tier slot
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+            self.finished_at = time.perf_counter()
+            self._done.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        """True once the background thread has exited and released the model"""
+        return self._done.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def matches(self, transcript):
+        return self.key == normalize_transcript(transcript)
+
+    def result(self, timeout=None):
+        """Wait for generation to finish and return the collected text"""
+        self._done.wait(timeout)
+        return "".join(self._parts)
+
+
+class SpeculationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def record_start(self):
+        with self._lock:
+            self.started += 1
+
+    def record_hit(self, saved_seconds):
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += max(0.0, saved_seconds)
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            resolved = self.hits + self.misses
+            return {
+                "speculations": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / resolved, 3) if resolved else None,
+                "saved_seconds_total": round(self.saved_seconds, 3),
+                "saved_seconds_avg": round(self.saved_seconds / self.hits, 3) if self.hits else None,
+            }
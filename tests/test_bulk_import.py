@@ -0,0 +1,83 @@
+import io
+import json
+
+import pytest
+
+from bulk_import import iter_bulk_records, validate_bulk_record
+
+RECORDS = [{"name": "a", "roll_no": "1"}, {"name": "b", "roll_no": "2", "remarks": "x" * 40}, {"name": "c", "roll_no": 3}]
+NDJSON = "".join(json.dumps(record) + "\n" for record in RECORDS)
+ARRAY = json.dumps(RECORDS)
+
+
+def parse(body, content_type="", chunk_size=64 * 1024):
+    return list(iter_bulk_records(io.BytesIO(body.encode("utf-8")), content_type, chunk_size))
+
+
+def rows(records):
+    return [(row, record, None) for row, record in enumerate(records, start=1)]
+
+
+@pytest.mark.parametrize("chunk_size", [64 * 1024, 1, 7, 16])
+@pytest.mark.parametrize("content_type", ["application/x-ndjson", ""])
+def test_ndjson_single_and_split_chunks(chunk_size, content_type):
+    assert parse(NDJSON, content_type, chunk_size) == rows(RECORDS)
+
+
+@pytest.mark.parametrize("chunk_size", [64 * 1024, 1, 7, 16])
+def test_ndjson_without_trailing_newline(chunk_size):
+    assert parse(NDJSON.rstrip("\n"), chunk_size=chunk_size) == rows(RECORDS)
+
+
+@pytest.mark.parametrize("chunk_size", [64 * 1024, 1, 7, 16])
+def test_array_single_and_split_chunks(chunk_size):
+    assert parse(ARRAY, "application/json", chunk_size) == rows(RECORDS)
+    assert parse(" \n" + json.dumps(RECORDS, indent=2) + "\n", chunk_size=chunk_size) == rows(RECORDS)
+
+
+def test_array_number_split_across_chunks():
+    assert parse("[12345, 6]", chunk_size=3) == rows([12345, 6])
+
+
+def test_empty_bodies():
+    assert parse("") == []
+    assert parse("  \n") == []
+    assert parse("[]") == []
+    assert parse("[ ]\n", chunk_size=1) == []
+
+
+def test_array_content_type_ndjson_parses_lines():
+    assert parse(NDJSON, "application/x-ndjson") == rows(RECORDS)
+
+
+def test_ndjson_bad_line_reports_error():
+    result = parse('{"name":"a","roll_no":"1"}\n{oops}\n')
+    assert result[0] == (1, {"name": "a", "roll_no": "1"}, None)
+    assert result[1][0] == 2 and result[1][1] is None and result[1][2].startswith("Invalid JSON")
+
+
+@pytest.mark.parametrize("chunk_size", [64 * 1024, 1, 5])
+@pytest.mark.parametrize("body", [
+    '[{"a":1} {"b":2}]',
+    '[,{"a":1}]',
+    '[{"a":1},,{"b":2}]',
+    '[{"a":1},]',
+    '[,]',
+    '[{"a":1}, oops]',
+    '[{"a":1}',
+    '[{"a":1}, {"b":',
+    '[{"a":1}] trailing',
+])
+def test_malformed_arrays_end_with_an_error(body, chunk_size):
+    result = parse(body, chunk_size=chunk_size)
+    assert result
+    *parsed, (_row, record, error) = result
+    assert record is None and error
+    assert all(error is None for _row, _record, error in parsed)
+
+
+def test_validate_bulk_record():
+    assert validate_bulk_record({"name": "a", "roll_no": "1"}, ("roll_no",)) == ("1", None)
+    assert validate_bulk_record([], ("roll_no",))[1] == "Record must be a JSON object"
+    assert validate_bulk_record({"roll_no": "1"}, ("roll_no",))[1] == "Missing 'name'"
+    assert validate_bulk_record({"name": "a"}, ("id", "email"))[1] == "Missing key field (id or email)"
@@ -0,0 +1,64 @@
+import threading
+
+from session_store import SessionStore
+
+
+def take_turn(store, session_id, question):
+    with store.session(session_id) as session:
+        list(session.data.get("history", []))
+    with store.session(session_id, write=True) as session:
+        session.data.setdefault("history", []).append(question)
+        session.touch()
+
+
+def read_history(path, session_id):
+    with SessionStore(path).session(session_id) as session:
+        return session.data.get("history", [])
+
+
+def test_shared_workers_keep_every_turn(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = SessionStore(path, shared=True, flush_interval=60)
+    second = SessionStore(path, shared=True, flush_interval=60)
+
+    # Both workers snapshot before either saves, as when two requests overlap
+    with first.session("s"):
+        pass
+    with second.session("s"):
+        pass
+    take_turn(first, "s", "a")
+    take_turn(second, "s", "b")
+    take_turn(first, "s", "c")
+    assert read_history(path, "s") == ["a", "b", "c"]
+
+    def worker(store, tag):
+        for number in range(20):
+            take_turn(store, "t", f"{tag}{number}")
+
+    threads = [threading.Thread(target=worker, args=(store, tag))
+               for store, tag in ((first, "x"), (second, "y"), (first, "z"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(read_history(path, "t")) == 60
+
+
+def test_shared_reads_see_other_workers_writes(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first = SessionStore(path, shared=True, flush_interval=60)
+    second = SessionStore(path, shared=True, flush_interval=60)
+    take_turn(first, "s", "a")
+    with second.session("s") as session:
+        assert session.data["history"] == ["a"]
+    take_turn(first, "s", "b")
+    with second.session("s") as session:
+        assert session.data["history"] == ["a", "b"]
+
+
+def test_write_behind_flush(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path, flush_interval=60)
+    take_turn(store, "s", "a")
+    assert store.flush() == 1
+    assert read_history(path, "s") == ["a"]
@@ -0,0 +1,49 @@
+import threading
+
+from speculation import SpeculationStats, SpeculativeAnswer, normalize_transcript
+
+
+def test_normalize_ignores_case_punctuation_and_fillers():
+    assert normalize_transcript("Um, what are MY marks?") == "what are my marks"
+    assert normalize_transcript("what are his marks") != normalize_transcript("what are my marks")
+
+
+def test_cancelled_speculation_stops_and_closes_its_stream():
+    release = threading.Event()
+    closed = threading.Event()
+
+    def produce(_text):
+        try:
+            yield "first "
+            release.wait(5)
+            yield "second"
+        finally:
+            closed.set()
+
+    speculation = SpeculativeAnswer("what are my marks", produce)
+    speculation.cancel()
+    assert not speculation.done or closed.is_set()
+    release.set()
+    assert speculation.result(5) in ("", "first ")
+    assert speculation.done and closed.is_set()
+
+
+def test_failed_generation_is_reported_as_an_error():
+    def produce(_text):
+        yield "partial"
+        raise ConnectionError("model went away")
+
+    speculation = SpeculativeAnswer("hello", produce)
+    speculation.result(5)
+    assert isinstance(speculation.error, ConnectionError)
+
+
+def test_stats_hit_rate_and_saved_time():
+    stats = SpeculationStats()
+    stats.record_start()
+    stats.record_start()
+    stats.record_hit(1.5)
+    stats.record_miss()
+    snapshot = stats.snapshot()
+    assert snapshot["hit_rate"] == 0.5
+    assert snapshot["saved_seconds_total"] == 1.5